@@ -1,12 +1,24 @@
-from flask import Flask, render_template, redirect, request, url_for, flash, session, jsonify, Response, stream_with_context
+from flask import Flask, render_template, redirect, request, url_for, flash, session, jsonify, Response, stream_with_context, send_from_directory, after_this_request, make_response
+from flask_session import Session
 import json
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
 import uuid
 from datetime import datetime
 import requests
 import time
+import hashlib
+import threading
+from memory import MemoryStore, format_memory_prompt
+from health import OllamaHealthMonitor
+from ratelimit import RateLimiter
+from storage import create_backend
+from chatcache import CachedChatBackend
+from batch import BatchJob, is_running as batch_is_running
+from auth import LoginBusy, LoginThrottle, PasswordHasher, RememberTokens
+from catalog import ModelCatalog
+from blobs import BlobStore
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your_secret_key_change_in_production')
@@ -17,9 +29,8 @@ alias = "vovagpt"
 HOME_DIR = os.path.expanduser("~")
 FILES_PATH = os.path.join(HOME_DIR, "script_files", alias)
 DATA_DIR = os.path.join(FILES_PATH, "data")
-USERS_FILE = os.path.join(DATA_DIR, 'users.json')
-CHATS_FILE = os.path.join(DATA_DIR, 'chats.json')
 MODELS_DIR = os.path.join(DATA_DIR, 'models')
+MEMORY_DIR = os.path.join(DATA_DIR, 'memory')
 
 # Ensure directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -29,10 +40,93 @@ os.makedirs(MODELS_DIR, exist_ok=True)
 # In k8s cluster: Set OLLAMA_HOST to the Ollama service name
 # Example: OLLAMA_HOST=http://ollama-service:11434
 OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+# Optional pool of inference backends for chats (comma separated); defaults to OLLAMA_HOST.
+# A chat family (a chat and all its forks) always sticks to one backend so Ollama's
+# prompt cache for the shared prefix is reused.
+OLLAMA_HOSTS = [h.strip() for h in os.getenv('OLLAMA_HOSTS', OLLAMA_HOST).split(',') if h.strip()]
+
+# Conversation memory (opt-in per user from Settings)
+MEMORY_EMBED_MODEL = os.getenv('MEMORY_EMBED_MODEL', 'nomic-embed-text')
+MEMORY_TOP_K = int(os.getenv('MEMORY_TOP_K', '3'))
+MEMORY_MIN_SCORE = float(os.getenv('MEMORY_MIN_SCORE', '0.3'))
+memory_store = MemoryStore(MEMORY_DIR, OLLAMA_HOST, MEMORY_EMBED_MODEL)
+
+# State backend for users, chats, sessions, locks and counters.
+# Local files/SQLite by default; set REDIS_URL to share state between replicas.
+REDIS_URL = os.getenv('REDIS_URL', '')
+# Recently active chats stay decoded in each worker; a shared per-chat version
+# counter tells the other workers when their copy is stale.
+CHAT_CACHE_MB = int(os.getenv('CHAT_CACHE_MB', '64'))
+state = CachedChatBackend(create_backend(DATA_DIR, REDIS_URL), CHAT_CACHE_MB * 1024 * 1024)
+# Filesystem sessions only: past this many files the oldest *live* sessions are deleted
+# (Flask-Session's default is 500), so keep it well above the number of signed-in users
+app.config['SESSION_FILE_THRESHOLD'] = int(os.getenv('SESSION_FILE_THRESHOLD', '50000'))
+state.configure_sessions(app)
+Session(app)
+
+# Message bodies above BLOB_THRESHOLD bytes are stored once, compressed, by content hash
+BLOB_THRESHOLD = int(os.getenv('BLOB_THRESHOLD', '4096'))
+blob_store = BlobStore(state, BLOB_THRESHOLD)
+
+# Rate limits / token quotas - counters shared by all workers and replicas
+rate_limiter = RateLimiter(state.counters)
+
+# Login: node-wide pool for password hashing, throttling, remember-me tokens.
+# Stored hashes are upgraded to PASSWORD_HASH_METHOD on the next successful login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+password_hasher = PasswordHasher(os.path.join(DATA_DIR, 'locks'), slots=int(os.getenv('LOGIN_HASH_SLOTS', '2')),
+                                 method=PASSWORD_HASH_METHOD, timeout=float(os.getenv('LOGIN_HASH_TIMEOUT', '5')))
+login_throttle = LoginThrottle(state.counters, ip_per_minute=int(os.getenv('LOGIN_IP_PER_MINUTE', '20')),
+                               user_failures=int(os.getenv('LOGIN_USER_FAILURES', '10')),
+                               account_failures=int(os.getenv('LOGIN_ACCOUNT_FAILURES', '200')))
+REMEMBER_COOKIE = 'remember_token'
+REMEMBER_DAYS = int(os.getenv('REMEMBER_DAYS', '30'))
+remember_tokens = RememberTokens(app.config['SECRET_KEY'], REMEMBER_DAYS)
+
+# Behind nginx/an ingress, trust this many X-Forwarded-* hops for the client IP
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# One Ollama probe per interval for the whole pod, however many dashboards are open
+HEALTH_INTERVAL = int(os.getenv('HEALTH_INTERVAL', '10'))
+health_monitor = OllamaHealthMonitor(OLLAMA_HOST, os.path.join(DATA_DIR, 'ollama_status.json'), HEALTH_INTERVAL)
+
+# Hardware-aware model catalog - verdicts from node hardware, speeds from calibration runs
+SLOW_TOKENS_PER_SEC = float(os.getenv('SLOW_TOKENS_PER_SEC', '5'))
+model_catalog = ModelCatalog(os.path.join(DATA_DIR, 'model_benchmarks.json'), OLLAMA_HOST, SLOW_TOKENS_PER_SEC,
+                             embed_models=[MEMORY_EMBED_MODEL])
+
+# Offline batch jobs (root dashboard uploads and batch.py)
+BATCH_DIR = os.path.join(DATA_DIR, 'batch')
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '2'))
+INFLIGHT_TTL = 900
+os.makedirs(BATCH_DIR, exist_ok=True)
+
+# Startup: start.sh waits for Ollama, wsgi.py calls warm_up(), PRELOAD_MODEL is loaded
+# in the background and /readyz stays 503 until it is
+PRELOAD_MODEL = os.getenv('PRELOAD_MODEL', '').strip()
+PRELOAD_STATUS_FILE = os.path.join(DATA_DIR, 'preload.json')
+PRELOAD_TIMEOUT = int(os.getenv('PRELOAD_TIMEOUT', '900'))
 
 print(f"🚀 VovaGPT starting...")
 print(f"📁 Data directory: {DATA_DIR}")
 print(f"🤖 Ollama host: {OLLAMA_HOST}")
+print(f"🗄️  State backend: {state.name}")
+
+# Fingerprinted static bundles (built by build_assets.py)
+STATIC_DIST_DIR = os.path.join(app.static_folder, 'dist')
+ASSET_MAX_AGE = 31536000
+ASSET_MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+def load_asset_manifest():
+    manifest_path = os.path.join(STATIC_DIST_DIR, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+asset_manifest = load_asset_manifest()
 
 # ------------------ Helpers ------------------
 
@@ -40,76 +134,288 @@ def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
-            flash("Please log in first.", "danger")
+            # Only for browsers that had a session - a flash would create a stored session for every anonymous hit
+            if request.cookies.get(app.config['SESSION_COOKIE_NAME']):
+                flash("Please log in first.", "danger")
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
 def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as file:
-            return json.load(file)
-    return []
+    return state.load_users()
 
 def save_users(users):
-    with open(USERS_FILE, 'w') as file:
-        json.dump(users, file, indent=4)
+    state.save_users(users)
 
 def get_root_user():
     users = load_users()
     return users[0] if users else None
 
+_root_registered = False
+
 def is_root_registered():
-    return bool(get_root_user())
+    # Root can't be unregistered from the UI, so stop re-reading users.json once it exists
+    global _root_registered
+    if not _root_registered:
+        _root_registered = bool(get_root_user())
+    return _root_registered
 
 def save_root_user(username, password):
-    password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+    password_hash = password_hasher.hash(password)
     users = [{"root_user": username, "password_hash": password_hash}, {"users": []}]
-    save_users(users)
+    with state.lock('users'):
+        save_users(users)
 
 def save_user(username, password):
-    password_hash = generate_password_hash(password, method='pbkdf2:sha256')
-    users = load_users()
-    users[1]['users'].append({
-        "username": username, 
-        "password_hash": password_hash,
-        "created_at": datetime.now().isoformat(),
-        "model_preference": "gpt-4"
-    })
-    save_users(users)
+    password_hash = password_hasher.hash(password)
+    with state.lock('users'):
+        users = load_users()
+        users[1]['users'].append({
+            "username": username, 
+            "password_hash": password_hash,
+            "created_at": datetime.now().isoformat(),
+            "model_preference": "gpt-4"
+        })
+        save_users(users)
 
 def remove_user(username):
-    users = load_users()
+    with state.lock('users'):
+        users = load_users()
+        if len(users) > 1:
+            users[1]['users'] = [user for user in users[1]['users'] if user['username'] != username]
+            save_users(users)
+            return True
+    return False
+
+def find_user(users, username):
+    """Return the stored record for a user (root record included)"""
+    if users and users[0].get('root_user') == username:
+        return users[0]
     if len(users) > 1:
-        users[1]['users'] = [user for user in users[1]['users'] if user['username'] != username]
+        for user in users[1]['users']:
+            if user['username'] == username:
+                return user
+    return None
+
+def upgrade_password_hash(username, password_hash, password):
+    """Re-hash at the configured cost after a successful login; returns the hash now stored"""
+    if not password_hasher.needs_rehash(password_hash):
+        return password_hash
+    try:
+        new_hash = password_hasher.hash(password)
+    except LoginBusy:
+        return password_hash  # next login will try again
+    with state.lock('users'):
+        users = load_users()
+        user = find_user(users, username)
+        if not user or user['password_hash'] != password_hash:
+            return user['password_hash'] if user else password_hash
+        user['password_hash'] = new_hash
         save_users(users)
-        return True
-    return False
+    print(f"🔐 Upgraded password hash for {username} to {password_hasher.method}")
+    return new_hash
 
-def load_chats():
-    if os.path.exists(CHATS_FILE):
-        with open(CHATS_FILE, 'r') as f:
-            return json.load(f)
-    return []
+def memory_enabled(username, user=None):
+    """Pass the already-loaded user record to skip reading users again"""
+    user = user or find_user(load_users(), username)
+    return bool(user and user.get('memory_enabled'))
+
+# Admin-managed settings (generation caps, rate limits) - stored by the state backend
+DEFAULT_SETTINGS = {
+    "generation_caps": {
+        "roles": {
+            "user": {"num_ctx": 4096, "num_predict": 1024, "num_thread": 4},
+            "root": {}
+        },
+        "models": {}
+    },
+    # 0 / missing means unlimited; per-user entries override the role defaults
+    "rate_limits": {
+        "roles": {
+            "user": {"requests_per_minute": 10, "tokens_per_day": 200000},
+            "root": {}
+        },
+        "users": {}
+    }
+}
+
+RATE_LIMIT_FIELDS = ("requests_per_minute", "tokens_per_day")
+
+def load_settings():
+    settings_data = json.loads(json.dumps(DEFAULT_SETTINGS))
+    settings_data.update(state.load_settings())
+    return settings_data
+
+def save_settings(settings_data):
+    state.save_settings(settings_data)
+
+def get_owned_chat(chat_id, username):
+    """Load a chat if it exists and belongs to the user"""
+    chat = state.get_chat(chat_id)
+    if chat and chat['created_by'] == username:
+        return chat
+    return None
+
+def get_rate_limits(username, role, settings_data=None):
+    limits_config = (settings_data or load_settings())['rate_limits']
+    limits = dict(limits_config['roles'].get(role, {}))
+    limits.update(limits_config['users'].get(username, {}))
+    return limits
+
+def parse_rate_limits(form, prefix):
+    limits = {}
+    for key in RATE_LIMIT_FIELDS:
+        raw = form.get(prefix + key, '').strip()
+        if raw.isdigit():
+            limits[key] = int(raw)
+    return limits
+
+# ------------------ Chat Branches ------------------
+# A fork stores only its own messages plus a reference to the parent chat and how
+# many of the parent's (resolved) messages it shares, so the common prefix is
+# never copied. Chats in one family share 'root_id'.
+
+def resolve_messages(chat):
+    """Full message history of a chat, following the parent chain"""
+    chain = [chat]
+    seen = {chat['id']}
+    while chain[-1].get('parent_id'):
+        parent = state.get_chat(chain[-1]['parent_id'])
+        if not parent:
+            print(f"⚠️  Parent {chain[-1]['parent_id']} of chat {chain[-1]['id']} is missing - history starts at the branch")
+            break
+        if parent['id'] in seen:
+            raise RuntimeError(f"Branch cycle at chat {parent['id']}")
+        seen.add(parent['id'])
+        chain.append(parent)
+    messages = list(chain[-1]['messages'])
+    for branch in reversed(chain[:-1]):
+        messages = messages[:branch['fork_length']] + branch['messages']
+    return messages
+
+def fork_chat(chat, fork_length, name=None):
+    """Create and store a branch sharing the first `fork_length` messages"""
+    # Hang the branch off the ancestor that owns the fork point, so repeated
+    # edits don't build an ever deeper chain (the shared prefix is the same)
+    parent = chat
+    while parent.get('parent_id') and fork_length <= parent['fork_length']:
+        ancestor = state.get_chat(parent['parent_id'])
+        if not ancestor:
+            break
+        parent = ancestor
+    branch = {
+        'id': str(uuid.uuid4()),
+        'name': name or f"⑂ {chat['name']}",
+        'created_at': datetime.now().isoformat(),
+        'created_by': chat['created_by'],
+        'messages': [],
+        'model': chat['model'],
+        'options': dict(chat.get('options') or {}),
+        'parent_id': parent['id'],
+        'fork_length': fork_length,
+        'root_id': chat.get('root_id', chat['id']),
+        'ollama_host': ollama_host_for(chat)
+    }
+    state.save_chat(branch)
+    return branch
+
+def chat_family(chat):
+    root_id = chat.get('root_id', chat['id'])
+    return [c for c in state.list_chats(chat['created_by']) if c.get('root_id', c['id']) == root_id]
+
+def detach_children(chat):
+    """Re-point forks of `chat` at its parent before it is deleted or cleared"""
+    own_start = chat.get('fork_length', 0) if chat.get('parent_id') else 0
+    for child in state.list_chats(chat['created_by']):
+        if child.get('parent_id') != chat['id']:
+            continue
+        with state.lock(f"chat:{child['id']}"):
+            child = state.get_chat(child['id'])
+            # Copy only the part of `chat`'s own messages the child relied on
+            borrowed = chat['messages'][:max(child['fork_length'] - own_start, 0)]
+            blob_store.retain(borrowed)
+            child['messages'] = borrowed + child['messages']
+            if chat.get('parent_id'):
+                child['parent_id'] = chat['parent_id']
+                child['fork_length'] = min(child['fork_length'], own_start)
+            else:
+                child.pop('parent_id', None)
+                child.pop('fork_length', None)
+            state.save_chat(child)
+
+# ------------------ Generation Options ------------------
+
+# Ollama options users may set, and the type each is parsed as
+GENERATION_OPTIONS = {
+    "temperature": float,
+    "num_ctx": int,
+    "num_predict": int,
+    "num_thread": int,
+}
 
-def save_chats(chats):
-    with open(CHATS_FILE, 'w') as f:
-        json.dump(chats, f, indent=2)
+def parse_generation_options(form, prefix=''):
+    """Read generation options from a form, skipping blank or invalid fields"""
+    options = {}
+    for key, cast in GENERATION_OPTIONS.items():
+        raw = form.get(prefix + key, '').strip()
+        if not raw:
+            continue
+        try:
+            value = cast(raw)
+        except ValueError:
+            continue
+        if value >= 0:
+            options[key] = value
+    return options
+
+def get_generation_caps(role, model, settings_data=None):
+    """Effective caps for a role and model - the tighter of both wins"""
+    caps_config = (settings_data or load_settings())['generation_caps']
+    caps = dict(caps_config['roles'].get(role, {}))
+    for key, value in caps_config['models'].get(model, {}).items():
+        caps[key] = min(caps[key], value) if key in caps else value
+    return caps
+
+def build_generation_options(user_options, chat_options, role, model, settings_data=None):
+    """Merge user and chat options (chat wins), then clamp to the admin caps"""
+    options = dict(user_options or {})
+    options.update(chat_options or {})
+    for key, cap in get_generation_caps(role, model, settings_data).items():
+        value = options.get(key)
+        if value is None:
+            # Resource options left unset would run with Ollama's (unbounded) defaults
+            if key != 'temperature':
+                options[key] = cap
+        elif value < 0 or value > cap:
+            options[key] = cap
+    return options
 
 # ------------------ Ollama Functions ------------------
 
-def get_ollama_models():
-    """Get list of downloaded Ollama models"""
+def get_ollama_model_entries():
+    """Downloaded Ollama models with their size in bytes and architecture family"""
     try:
         response = requests.get(f"{OLLAMA_HOST}/api/tags", timeout=5)
         if response.status_code == 200:
             data = response.json()
-            return [model['name'] for model in data.get('models', [])]
+            return [{'name': model['name'], 'size_bytes': model.get('size'),
+                     'family': (model.get('details') or {}).get('family'),
+                     'families': (model.get('details') or {}).get('families')}
+                    for model in data.get('models', [])]
         return []
     except Exception as e:
         print(f"Error getting models: {e}")
         return []
 
+def get_ollama_models():
+    """Get list of downloaded Ollama models"""
+    return [m['name'] for m in get_ollama_model_entries()]
+
+def recommended_model(model_entries):
+    """Fastest downloaded chat model that fits this node (measured first, then estimated)"""
+    chat_models = [m['name'] for m in model_entries if not model_catalog.is_embedding(m)]
+    return model_catalog.recommend(model_entries) or (chat_models[0] if chat_models else None)
+
 def get_available_ollama_models():
     """Get list of popular Ollama models available for download"""
     # Popular Ollama models
@@ -159,20 +465,37 @@ def delete_ollama_model(model_name):
         print(f"Error deleting model: {e}")
         return False
 
-def get_ai_response(messages, model):
+def pick_ollama_host(family_id):
+    """Stable backend choice for a chat family"""
+    digest = hashlib.sha1(family_id.encode('utf-8')).hexdigest()
+    return OLLAMA_HOSTS[int(digest, 16) % len(OLLAMA_HOSTS)]
+
+def ollama_host_for(chat):
+    host = chat.get('ollama_host')
+    if host in OLLAMA_HOSTS:
+        return host
+    return pick_ollama_host(chat.get('root_id', chat['id']))
+
+def get_ai_response(messages, model, options=None, host=None):
     """Get response from Ollama model"""
+    host = host or OLLAMA_HOST
     try:
-        print(f"[DEBUG] Sending request to {OLLAMA_HOST}/api/chat")
+        print(f"[DEBUG] Sending request to {host}/api/chat")
         print(f"[DEBUG] Model: {model}")
         print(f"[DEBUG] Messages count: {len(messages)}")
+        print(f"[DEBUG] Options: {options}")
+        
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": False
+        }
+        if options:
+            payload["options"] = options
         
         response = requests.post(
-            f"{OLLAMA_HOST}/api/chat",
-            json={
-                "model": model,
-                "messages": messages,
-                "stream": False
-            },
+            f"{host}/api/chat",
+            json=payload,
             timeout=600  # Increased to 10 minutes for first load
         )
         
@@ -184,7 +507,10 @@ def get_ai_response(messages, model):
             if 'message' in data and 'content' in data['message']:
                 content = data['message']['content']
                 print(f"[DEBUG] Got response, length: {len(content)}")
-                return {"content": content}
+                return {
+                    "content": content,
+                    "tokens": data.get('prompt_eval_count', 0) + data.get('eval_count', 0)
+                }
             else:
                 print(f"[DEBUG] Full response: {data}")
                 return {"error": f"Unexpected response format: {data}"}
@@ -199,14 +525,184 @@ def get_ai_response(messages, model):
         print(f"[DEBUG] Exception: {type(e).__name__}: {str(e)}")
         return {"error": f"Ollama error: {str(e)}. Make sure Ollama is running."}
 
+# ------------------ Batch Jobs ------------------
+
+def track_inflight(host, delta):
+    """Count chat requests running on a backend so batch jobs can step aside"""
+    try:
+        state.counters.incr(f"inflight:{host}", delta, ttl=INFLIGHT_TTL)
+    except Exception as e:
+        print(f"[DEBUG] In-flight counter error: {type(e).__name__}: {str(e)}")
+
+def interactive_busy(host):
+    return state.counters.get(f"inflight:{host}") > 0
+
+def make_batch_job(input_path, output_path, model, concurrency=BATCH_CONCURRENCY, status_path=None):
+    """Batch job wired to the same backends, caps and in-flight counters as chats"""
+    def build_options(item_model, requested):
+        requested = parse_generation_options({k: str(v) for k, v in (requested or {}).items()})
+        return build_generation_options(None, requested, 'root', item_model)
+    return BatchJob(input_path, output_path, model, generate=get_ai_response, route=pick_ollama_host,
+                    build_options=build_options, is_busy=interactive_busy, concurrency=concurrency,
+                    status_path=status_path)
+
+def batch_job_dir(job_id):
+    return os.path.join(BATCH_DIR, job_id)
+
+def load_batch_job(job_id):
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(batch_job_dir(job_id), 'job.json'), 'r') as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if job.get('status') == 'running' and not batch_is_running(os.path.join(batch_job_dir(job_id), 'output.jsonl')):
+        job['status'] = 'interrupted'
+    return job
+
+def list_batch_jobs():
+    jobs = [load_batch_job(job_id) for job_id in os.listdir(BATCH_DIR)]
+    return sorted([j for j in jobs if j], key=lambda j: j.get('created_at', ''), reverse=True)
+
+def start_batch_job(job_id):
+    """Run a stored job in a background thread of this worker"""
+    job_dir = batch_job_dir(job_id)
+    job = load_batch_job(job_id)
+    batch = make_batch_job(os.path.join(job_dir, 'input.jsonl'), os.path.join(job_dir, 'output.jsonl'),
+                           job.get('model'), concurrency=job.get('concurrency', BATCH_CONCURRENCY),
+                           status_path=os.path.join(job_dir, 'job.json'))
+    
+    def run():
+        try:
+            batch.run()
+        except Exception as e:
+            print(f"❌ Batch job {job_id} failed: {type(e).__name__}: {str(e)}")
+    
+    threading.Thread(target=run, name=f'batch-{job_id}', daemon=True).start()
+
+# ------------------ Startup & Readiness ------------------
+
+def warm_up():
+    """Load storage, memory indexes and the model catalog before workers take traffic"""
+    started = time.monotonic()
+    users = load_users()
+    load_settings()
+    chats = state.load_chats()
+    state.counters.purge()
+    
+    records = users[:1] + (users[1]['users'] if len(users) > 1 else [])
+    indexed = 0
+    for record in records:
+        if record.get('memory_enabled'):
+            indexed += len(memory_store.index_for(record.get('root_user') or record['username']))
+    
+    status = health_monitor.refresh()
+    model_catalog.hardware()
+    print(f"🔥 Warm-up: {len(records)} users, {len(chats)} chats, {indexed} memory entries, "
+          f"Ollama {status['status']} with {status.get('models', 0)} models "
+          f"({time.monotonic() - started:.1f}s)")
+
+def model_tag(name):
+    return name if ':' in name else f"{name}:latest"
+
+def preload_pending():
+    """Name of the model warmup.py is still loading, if any"""
+    try:
+        with open(PRELOAD_STATUS_FILE, 'r') as f:
+            preload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if preload.get('status') == 'loading' and time.time() - preload.get('started_at', 0) < PRELOAD_TIMEOUT:
+        return preload.get('model')
+    return None
+
+@app.template_global()
+def asset_url(name):
+    """URL of a static bundle - fingerprinted when built, source file otherwise"""
+    fingerprinted = asset_manifest.get(name)
+    if fingerprinted:
+        return url_for('static_dist', filename=fingerprinted)
+    folder = 'css' if name.endswith('.css') else 'js'
+    return url_for('static', filename=f'{folder}/{name}')
+
 # ------------------ Routes ------------------
 
 @app.before_request
 def check_root_user():
     if not is_root_registered():
-        if request.endpoint not in ('register_root', 'static'):
+        if request.endpoint not in ('register_root', 'static', 'static_dist', 'healthz', 'readyz'):
             return redirect(url_for('register_root'))
 
+@app.before_request
+def restore_remembered_login():
+    """Log a user back in from a remember-me cookie - no password hashing involved"""
+    if 'user_id' in session or request.endpoint in ('static', 'static_dist', 'healthz', 'readyz'):
+        return
+    token = request.cookies.get(REMEMBER_COOKIE)
+    if not token:
+        return
+    remembered = remember_tokens.load(token)
+    user = find_user(load_users(), remembered[0]) if remembered else None
+    if user and remember_tokens.matches(remembered[1], user['password_hash']):
+        session['user_id'] = remembered[0]
+        session['is_root'] = 'root_user' in user
+        return
+    
+    @after_this_request
+    def forget_token(response):
+        response.delete_cookie(REMEMBER_COOKIE)
+        return response
+
+@app.route('/static/dist/<path:filename>')
+def static_dist(filename):
+    """Serve fingerprinted bundles, preferring the precompressed variants"""
+    accepted = request.headers.get('Accept-Encoding', '')
+    mimetype = ASSET_MIMETYPES.get(os.path.splitext(filename)[1])
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.exists(os.path.join(STATIC_DIST_DIR, filename + suffix)):
+            response = send_from_directory(STATIC_DIST_DIR, filename + suffix, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(STATIC_DIST_DIR, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """Liveness - the worker is up and answering"""
+    return jsonify({"status": "ok", "version": app_version})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness - storage answers, Ollama is up and the preloaded model (if any) is ready"""
+    checks = {}
+    try:
+        state.counters.get('readyz')
+        load_settings()
+        checks['storage'] = {'ok': True, 'backend': state.name}
+    except Exception as e:
+        checks['storage'] = {'ok': False, 'backend': state.name, 'error': str(e)}
+    
+    status, _ = health_monitor.current()
+    checks['ollama'] = {'ok': bool(status.get('connected')), 'status': status.get('status'),
+                        'models': status.get('models', 0), 'loaded': status.get('loaded', [])}
+    
+    # No model requirement otherwise: a fresh install has to be reachable to download one
+    if PRELOAD_MODEL:
+        downloaded = model_tag(PRELOAD_MODEL) in [model_tag(m) for m in status.get('model_names', [])]
+        loading = preload_pending() is not None
+        checks['preload'] = {'ok': downloaded and not loading, 'model': PRELOAD_MODEL,
+                             'downloaded': downloaded, 'loading': loading}
+    
+    ready = all(check['ok'] for check in checks.values())
+    response = jsonify({"ready": ready, "checks": checks})
+    response.headers['Cache-Control'] = 'no-store'
+    return response, (200 if ready else 503)
+
 @app.route('/')
 def index():
     if not is_root_registered():
@@ -224,7 +720,11 @@ def register_root():
         if password != confirm_password:
             flash('Passwords do not match!', 'danger')
         else:
-            save_root_user(username, password)
+            try:
+                save_root_user(username, password)
+            except LoginBusy:
+                flash('Server is busy, please try again in a moment.', 'danger')
+                return render_template('register_root.html', app_version=app_version), 503
             flash('Root user registered successfully!', 'success')
             return redirect(url_for('login'))
     return render_template('register_root.html', app_version=app_version)
@@ -238,34 +738,50 @@ def register_user():
         if password != confirm_password:
             flash('Passwords do not match!', 'danger')
         else:
-            save_user(username, password)
+            try:
+                save_user(username, password)
+            except LoginBusy:
+                flash('Server is busy, please try again in a moment.', 'danger')
+                return render_template('register_user.html', app_version=app_version), 503
             flash('User registered successfully!', 'success')
             return redirect(url_for('login'))
     return render_template('register_user.html', app_version=app_version)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
+    if request.method == 'GET' and 'user_id' in session:
+        return redirect(url_for('dashboard'))
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        users = load_users()
-        root_user = users[0] if users else None
-        regular_users = users[1]['users'] if len(users) > 1 else []
         
-        if root_user and username == root_user['root_user']:
-            if check_password_hash(root_user['password_hash'], password):
-                session['user_id'] = username
-                session['is_root'] = True
-                flash("Logged in as root.", "success")
-                return redirect(url_for('dashboard'))
+        # Throttle before hashing so rejected attempts cost no CPU
+        throttled = login_throttle.check(request.remote_addr, username)
+        if throttled:
+            flash(throttled, "danger")
+            return render_template('login.html', app_version=app_version), 429
         
-        for user in regular_users:
-            if user['username'] == username and check_password_hash(user['password_hash'], password):
-                session['user_id'] = username
-                session['is_root'] = False
-                flash("Logged in successfully.", "success")
-                return redirect(url_for('dashboard'))
+        user = find_user(load_users(), username)
+        try:
+            valid = bool(user) and password_hasher.verify(user['password_hash'], password)
+        except LoginBusy:
+            flash("Too many logins right now, please try again in a moment.", "danger")
+            return render_template('login.html', app_version=app_version), 503
         
+        if valid:
+            is_root = 'root_user' in user
+            password_hash = upgrade_password_hash(username, user['password_hash'], password)
+            session['user_id'] = username
+            session['is_root'] = is_root
+            flash("Logged in as root." if is_root else "Logged in successfully.", "success")
+            response = redirect(url_for('dashboard'))
+            if request.form.get('remember'):
+                response.set_cookie(REMEMBER_COOKIE, remember_tokens.issue(username, password_hash),
+                                    max_age=REMEMBER_DAYS * 86400, httponly=True, samesite='Lax',
+                                    secure=request.is_secure)
+            return response
+        
+        login_throttle.record_failure(username, request.remote_addr)
         flash("Invalid credentials.", "danger")
     return render_template('login.html', app_version=app_version)
 
@@ -275,8 +791,13 @@ def dashboard():
     username = session.get('user_id', 'Unknown')
     role = "root" if session.get('is_root') else "user"
     
-    chats = load_chats()
-    user_chats = [chat for chat in chats if chat['created_by'] == username]
+    # Branches are reached from their chat, the dashboard lists one card per family
+    all_chats = state.list_chats(username)
+    user_chats = [chat for chat in all_chats if not chat.get('parent_id')]
+    branch_counts = {}
+    for chat in all_chats:
+        root_id = chat.get('root_id', chat['id'])
+        branch_counts[root_id] = branch_counts.get(root_id, 0) + 1
     
     # Get user preferences
     users = load_users()
@@ -289,21 +810,31 @@ def dashboard():
     else:
         user_data = {"model_preference": "llama3.2:latest"}
     
-    # Get Ollama models
-    downloaded_models = get_ollama_models()
-    available_models = get_available_ollama_models()
+    # Get Ollama models, rated against this node's hardware
+    model_entries = get_ollama_model_entries()
+    downloaded_models = [m['name'] for m in model_entries]
+    model_ratings = {m['name']: m for m in model_catalog.annotate(model_entries)}
+    available_models = model_catalog.annotate(get_available_ollama_models())
     
     # Filter out already downloaded models from available list
     downloaded_names = set(downloaded_models)
     available_models = [m for m in available_models if m['name'] not in downloaded_names]
     
+    quota = rate_limiter.usage(username, get_rate_limits(username, role))
+    
     return render_template(
         'dashboard.html',
         username=username,
         role=role,
+        quota=quota,
+        branch_counts=branch_counts,
         user_chats=user_chats,
         user_data=user_data,
         downloaded_models=downloaded_models,
+        model_ratings=model_ratings,
+        recommended_model=recommended_model(model_entries),
+        hardware=model_catalog.hardware(),
+        calibrating=model_catalog.calibrating(),
         available_models=available_models,
         app_version=app_version
     )
@@ -317,7 +848,128 @@ def root_dashboard():
     
     users_data = load_users()
     user_list = users_data[1]['users'] if len(users_data) > 1 else []
-    return render_template('root_dashboard.html', users=user_list, app_version=app_version)
+    caps = load_settings()['generation_caps']
+    capped_models = sorted(set(get_ollama_models()) | set(caps['models']))
+    rate_limits = load_settings()['rate_limits']
+    return render_template('root_dashboard.html', users=user_list, caps=caps, capped_models=capped_models,
+                           generation_options=GENERATION_OPTIONS, rate_limits=rate_limits,
+                           rate_limit_fields=RATE_LIMIT_FIELDS, batch_jobs=list_batch_jobs(),
+                           models=get_ollama_models(), batch_concurrency=BATCH_CONCURRENCY,
+                           app_version=app_version)
+
+@app.route('/root_dashboard/rate_limits', methods=['POST'])
+@login_required
+def update_rate_limits():
+    if not session.get('is_root'):
+        flash("Access denied", "danger")
+        return redirect(url_for('dashboard'))
+    
+    with state.lock('settings'):
+        settings_data = load_settings()
+        limits = settings_data['rate_limits']
+        limits['roles'] = {role: parse_rate_limits(request.form, f'role:{role}:') for role in ('user', 'root')}
+        limits['users'] = {}
+        for username in request.form.getlist('username'):
+            user_limits = parse_rate_limits(request.form, f'user:{username}:')
+            if user_limits:
+                limits['users'][username] = user_limits
+        save_settings(settings_data)
+    
+    flash("Rate limits updated!", "success")
+    return redirect(url_for('root_dashboard'))
+
+@app.route('/root_dashboard/generation_caps', methods=['POST'])
+@login_required
+def update_generation_caps():
+    if not session.get('is_root'):
+        flash("Access denied", "danger")
+        return redirect(url_for('dashboard'))
+    
+    with state.lock('settings'):
+        settings_data = load_settings()
+        caps = settings_data['generation_caps']
+        caps['roles'] = {role: parse_generation_options(request.form, f'role:{role}:') for role in ('user', 'root')}
+        models = request.form.getlist('model')
+        new_model = request.form.get('new_model', '').strip()
+        if new_model:
+            models.append(new_model)
+        caps['models'] = {}
+        for model in models:
+            model_caps = parse_generation_options(request.form, f'model:{model}:')
+            if model == new_model:
+                model_caps = parse_generation_options(request.form, 'model:__new__:')
+            if model_caps:
+                caps['models'][model] = model_caps
+        save_settings(settings_data)
+    
+    flash("Generation caps updated!", "success")
+    return redirect(url_for('root_dashboard'))
+
+@app.route('/root_dashboard/batch', methods=['POST'])
+@login_required
+def create_batch_job():
+    if not session.get('is_root'):
+        flash("Access denied", "danger")
+        return redirect(url_for('dashboard'))
+    
+    upload = request.files.get('prompts')
+    model = request.form.get('model', '').strip()
+    if not upload or not upload.filename:
+        flash("Choose a JSONL file of prompts", "danger")
+        return redirect(url_for('root_dashboard'))
+    try:
+        concurrency = max(1, int(request.form.get('concurrency') or BATCH_CONCURRENCY))
+    except ValueError:
+        concurrency = BATCH_CONCURRENCY
+    
+    job_id = uuid.uuid4().hex[:12]
+    job_dir = batch_job_dir(job_id)
+    os.makedirs(job_dir)
+    upload.save(os.path.join(job_dir, 'input.jsonl'))
+    with open(os.path.join(job_dir, 'job.json'), 'w') as f:
+        json.dump({
+            'id': job_id,
+            'filename': upload.filename,
+            'model': model or None,
+            'concurrency': concurrency,
+            'status': 'queued',
+            'created_by': session.get('user_id'),
+            'created_at': datetime.now().isoformat()
+        }, f, indent=2)
+    
+    start_batch_job(job_id)
+    flash(f"Batch job {job_id} started", "success")
+    return redirect(url_for('root_dashboard'))
+
+@app.route('/root_dashboard/batch/<job_id>/resume', methods=['POST'])
+@login_required
+def resume_batch_job(job_id):
+    if not session.get('is_root'):
+        flash("Access denied", "danger")
+        return redirect(url_for('dashboard'))
+    
+    job = load_batch_job(job_id)
+    if not job:
+        flash("Batch job not found", "danger")
+    elif job['status'] == 'running':
+        flash("Batch job is already running", "danger")
+    else:
+        start_batch_job(job_id)
+        flash(f"Batch job {job_id} resumed", "success")
+    return redirect(url_for('root_dashboard'))
+
+@app.route('/root_dashboard/batch/<job_id>/output')
+@login_required
+def batch_job_output(job_id):
+    if not session.get('is_root'):
+        flash("Access denied", "danger")
+        return redirect(url_for('dashboard'))
+    
+    if not load_batch_job(job_id) or not os.path.exists(os.path.join(batch_job_dir(job_id), 'output.jsonl')):
+        flash("No results yet", "danger")
+        return redirect(url_for('root_dashboard'))
+    return send_from_directory(batch_job_dir(job_id), 'output.jsonl', as_attachment=True,
+                               download_name=f"{job_id}.results.jsonl", mimetype='application/x-ndjson')
 
 @app.route('/remove_user', methods=['POST'])
 @login_required
@@ -338,23 +990,22 @@ def new_chat():
     chat_name = request.form.get('chat_name', 'New Chat').strip()
     model = request.form.get('model', '')
     
-    # If no model specified, use first available downloaded model
+    # If no model specified, use the fastest downloaded model that fits this node
     if not model:
-        downloaded_models = get_ollama_models()
-        model = downloaded_models[0] if downloaded_models else 'llama3.2:latest'
+        model = recommended_model(get_ollama_model_entries()) or 'llama3.2:latest'
     
+    chat_id = str(uuid.uuid4())
     new_chat = {
-        'id': str(uuid.uuid4()),
+        'id': chat_id,
         'name': chat_name,
         'created_at': datetime.now().isoformat(),
         'created_by': username,
         'messages': [],
-        'model': model
+        'model': model,
+        'ollama_host': pick_ollama_host(chat_id)
     }
     
-    chats = load_chats()
-    chats.append(new_chat)
-    save_chats(chats)
+    state.save_chat(new_chat)
     
     flash('New chat created!', 'success')
     return redirect(url_for('view_chat', chat_id=new_chat['id']))
@@ -363,8 +1014,7 @@ def new_chat():
 @login_required
 def view_chat(chat_id):
     username = session.get('user_id')
-    chats = load_chats()
-    chat = next((c for c in chats if c['id'] == chat_id), None)
+    chat = state.get_chat(chat_id)
     
     if not chat:
         flash("Chat not found.", "danger")
@@ -374,40 +1024,76 @@ def view_chat(chat_id):
         flash("Access denied.", "danger")
         return redirect(url_for('dashboard'))
     
-    return render_template('chat.html', chat=chat, app_version=app_version)
+    branches = chat_family(chat)
+    return render_template('chat.html', chat=chat, messages=blob_store.inflate(resolve_messages(chat)), branches=branches,
+                           app_version=app_version)
 
 @app.route('/chat/<chat_id>/message', methods=['POST'])
 @login_required
 def send_message(chat_id):
     username = session.get('user_id')
-    chats = load_chats()
-    chat = next((c for c in chats if c['id'] == chat_id), None)
+    chat = get_owned_chat(chat_id, username)
     
-    if not chat or chat['created_by'] != username:
+    if not chat:
         return jsonify({"error": "Chat not found"}), 404
     
     user_message = request.json.get('message', '').strip()
     if not user_message:
         return jsonify({"error": "Empty message"}), 400
     
+    return generate_reply(chat, username, user_message)
+
+def check_rate_limit(username, settings_data=None):
+    """Count a generation request; error message if the user is over their limits"""
+    role = "root" if session.get('is_root') else "user"
+    return rate_limiter.check(username, get_rate_limits(username, role, settings_data))
+
+def generate_reply(chat, username, user_message, limit_checked=False, settings_data=None):
+    """Send a user message to the chat's model and store both sides of the turn"""
+    chat_id = chat['id']
+    role = "root" if session.get('is_root') else "user"
+    # Users and settings are read once per turn and handed to every check below
+    settings_data = settings_data or load_settings()
+    user_record = find_user(load_users(), username) or {}
+    limit_error = None if limit_checked else check_rate_limit(username, settings_data)
+    if limit_error:
+        return jsonify({"error": limit_error}), 429
+    
     # Add user message
-    chat['messages'].append({
+    user_entry = {
         'id': str(uuid.uuid4()),
         'role': 'user',
         'content': user_message,
         'timestamp': datetime.now().isoformat()
-    })
+    }
+    
+    # Prepare messages for AI (forks include the prefix shared with their parent)
+    history = blob_store.inflate(resolve_messages(chat)) + [user_entry]
+    ai_messages = [{"role": m['role'], "content": m['content']} for m in history]
     
-    # Prepare messages for AI
-    ai_messages = [{"role": m['role'], "content": m['content']} for m in chat['messages']]
+    use_memory = memory_enabled(username, user_record)
+    if use_memory:
+        snippets = memory_store.search(username, user_message, k=MEMORY_TOP_K,
+                                       exclude_chat=chat_id, min_score=MEMORY_MIN_SCORE)
+        if snippets:
+            ai_messages.insert(0, {"role": "system", "content": format_memory_prompt(snippets)})
     
     # Get AI response
     model = chat.get('model', 'gpt-4')
-    ai_result = get_ai_response(ai_messages, model)
+    options = build_generation_options(user_record.get('generation_options'), chat.get('options'), role, model,
+                                       settings_data)
+    host = ollama_host_for(chat)
+    track_inflight(host, 1)
+    try:
+        ai_result = get_ai_response(ai_messages, model, options, host=host)
+    finally:
+        track_inflight(host, -1)
     
     if 'error' in ai_result:
         return jsonify({"error": ai_result['error']}), 500
     
+    rate_limiter.record_tokens(username, ai_result['tokens'])
+    
     # Add AI response
     ai_message = {
         'id': str(uuid.uuid4()),
@@ -415,15 +1101,79 @@ def send_message(chat_id):
         'content': ai_result['content'],
         'timestamp': datetime.now().isoformat()
     }
-    chat['messages'].append(ai_message)
     
-    # Update chat name if it's the first message
-    if len(chat['messages']) == 2:  # user + assistant
-        chat['name'] = user_message[:50] + ('...' if len(user_message) > 50 else '')
+    # Re-read under the lock: the chat may have changed on another worker/replica
+    # while the model was generating
+    with state.lock(f'chat:{chat_id}'):
+        chat = get_owned_chat(chat_id, username)
+        if not chat:
+            return jsonify({"error": "Chat not found"}), 404
+        chat['messages'].extend([blob_store.stash(user_entry), blob_store.stash(ai_message)])
+        
+        # Update chat name if it's the first message (branches keep their fork name)
+        if len(chat['messages']) == 2 and not chat.get('parent_id'):  # user + assistant
+            chat['name'] = user_message[:50] + ('...' if len(user_message) > 50 else '')
+        
+        state.save_chat(chat)
+    
+    if use_memory:
+        memory_store.enqueue(username, chat_id, user_entry)
+        memory_store.enqueue(username, chat_id, ai_message)
+    
+    return jsonify({"message": ai_message, "user_message": user_entry, "chat_id": chat_id})
+
+@app.route('/chat/<chat_id>/fork', methods=['POST'])
+@login_required
+def fork_chat_route(chat_id):
+    """Branch a chat after a given message (default: after the last one)"""
+    username = session.get('user_id')
+    chat = get_owned_chat(chat_id, username)
+    if not chat:
+        flash("Chat not found.", "danger")
+        return redirect(url_for('dashboard'))
+    
+    history = resolve_messages(chat)
+    message_id = request.form.get('message_id')
+    fork_length = len(history)
+    if message_id:
+        fork_length = next((i + 1 for i, m in enumerate(history) if m['id'] == message_id), fork_length)
     
-    save_chats(chats)
+    branch = fork_chat(chat, fork_length)
+    flash("Branch created.", "success")
+    return redirect(url_for('view_chat', chat_id=branch['id']))
+
+@app.route('/chat/<chat_id>/edit', methods=['POST'])
+@login_required
+def edit_message(chat_id):
+    """Edit an earlier user message and regenerate from there on a new branch"""
+    username = session.get('user_id')
+    chat = get_owned_chat(chat_id, username)
+    if not chat:
+        return jsonify({"error": "Chat not found"}), 404
     
-    return jsonify({"message": ai_message})
+    user_message = request.json.get('message', '').strip()
+    if not user_message:
+        return jsonify({"error": "Empty message"}), 400
+    
+    history = resolve_messages(chat)
+    message_id = request.json.get('message_id')
+    index = next((i for i, m in enumerate(history) if m['id'] == message_id and m['role'] == 'user'), None)
+    if index is None:
+        return jsonify({"error": "Message not found"}), 404
+    
+    # Check limits before the branch exists, and drop it if generation fails,
+    # so failed edits don't leave empty branches in the switcher
+    settings_data = load_settings()
+    limit_error = check_rate_limit(username, settings_data)
+    if limit_error:
+        return jsonify({"error": limit_error}), 429
+    branch = fork_chat(chat, index)
+    response = make_response(generate_reply(branch, username, user_message, limit_checked=True,
+                                            settings_data=settings_data))
+    if response.status_code != 200:
+        with state.lock(f"chat:{branch['id']}"):
+            state.delete_chat(branch['id'])
+    return response
 
 @app.route('/chat/<chat_id>/rename', methods=['POST'])
 @login_required
@@ -431,13 +1181,12 @@ def rename_chat(chat_id):
     username = session.get('user_id')
     new_name = request.form.get('chat_name', '').strip()
     
-    chats = load_chats()
-    for chat in chats:
-        if chat['id'] == chat_id and chat['created_by'] == username:
+    with state.lock(f'chat:{chat_id}'):
+        chat = get_owned_chat(chat_id, username)
+        if chat:
             chat['name'] = new_name or "Unnamed Chat"
-            break
+            state.save_chat(chat)
     
-    save_chats(chats)
     flash("Chat renamed!", "success")
     return redirect(url_for('view_chat', chat_id=chat_id))
 
@@ -445,9 +1194,13 @@ def rename_chat(chat_id):
 @login_required
 def delete_chat(chat_id):
     username = session.get('user_id')
-    chats = load_chats()
-    chats = [c for c in chats if not (c['id'] == chat_id and c['created_by'] == username)]
-    save_chats(chats)
+    with state.lock(f'chat:{chat_id}'):
+        chat = get_owned_chat(chat_id, username)
+        if chat:
+            detach_children(chat)
+            state.delete_chat(chat_id)
+            blob_store.release(chat['messages'])
+    memory_store.forget_chat(username, chat_id)
     
     flash("Chat deleted successfully.", "success")
     return redirect(url_for('dashboard'))
@@ -456,17 +1209,33 @@ def delete_chat(chat_id):
 @login_required
 def clear_chat(chat_id):
     username = session.get('user_id')
-    chats = load_chats()
-    
-    for chat in chats:
-        if chat['id'] == chat_id and chat['created_by'] == username:
+    with state.lock(f'chat:{chat_id}'):
+        chat = get_owned_chat(chat_id, username)
+        if chat:
+            detach_children(chat)
+            blob_store.release(chat['messages'])
+            # A cleared branch no longer shows its parent's prefix either
             chat['messages'] = []
-            break
-    
-    save_chats(chats)
+            chat.pop('parent_id', None)
+            chat.pop('fork_length', None)
+            state.save_chat(chat)
+    memory_store.forget_chat(username, chat_id)
     flash("Chat history cleared.", "info")
     return redirect(url_for('view_chat', chat_id=chat_id))
 
+@app.route('/chat/<chat_id>/options', methods=['POST'])
+@login_required
+def chat_options(chat_id):
+    username = session.get('user_id')
+    with state.lock(f'chat:{chat_id}'):
+        chat = get_owned_chat(chat_id, username)
+        if chat:
+            chat['options'] = parse_generation_options(request.form)
+            state.save_chat(chat)
+    
+    flash("Generation options saved.", "success")
+    return redirect(url_for('view_chat', chat_id=chat_id))
+
 @app.route('/model/download/<path:model_name>')
 @login_required
 def download_model(model_name):
@@ -504,38 +1273,41 @@ def delete_model(model_name):
 @login_required
 def list_models():
     """API endpoint to get current models"""
+    model_entries = get_ollama_model_entries()
     return jsonify({
-        'downloaded': get_ollama_models(),
-        'available': get_available_ollama_models()
+        'downloaded': [m['name'] for m in model_entries],
+        'available': get_available_ollama_models(),
+        'ratings': model_catalog.annotate(model_entries),
+        'recommended': recommended_model(model_entries),
+        'hardware': model_catalog.hardware()
     })
 
+@app.route('/models/calibrate', methods=['POST'])
+@login_required
+def calibrate_models():
+    """Benchmark every downloaded model in the background (root only)"""
+    if not session.get('is_root'):
+        flash("Access denied", "danger")
+        return redirect(url_for('dashboard'))
+    
+    if model_catalog.calibrating():
+        flash("Calibration is already running", "info")
+    else:
+        models = [m for m in get_ollama_model_entries() if not model_catalog.is_embedding(m)]
+        model_catalog.calibrate_async(models)
+        flash(f"Benchmarking {len(models)} model(s) - results appear on the dashboard as they finish", "success")
+    return redirect(url_for('dashboard'))
+
 @app.route('/ollama/status')
 @login_required
 def ollama_status():
-    """Check if Ollama is connected and responding"""
-    try:
-        response = requests.get(f"{OLLAMA_HOST}/api/tags", timeout=2)
-        if response.status_code == 200:
-            data = response.json()
-            model_count = len(data.get('models', []))
-            return jsonify({
-                'connected': True,
-                'status': 'online',
-                'models': model_count,
-                'host': OLLAMA_HOST
-            })
-        else:
-            return jsonify({
-                'connected': False,
-                'status': 'error',
-                'error': f'HTTP {response.status_code}'
-            })
-    except Exception as e:
-        return jsonify({
-            'connected': False,
-            'status': 'offline',
-            'error': str(e)
-        })
+    """Latest Ollama health snapshot published by the background monitor"""
+    status, etag = health_monitor.current()
+    response = jsonify(status)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = HEALTH_INTERVAL
+    return response.make_conditional(request)
 
 @app.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -545,17 +1317,25 @@ def settings():
     
     if request.method == 'POST':
         model_preference = request.form.get('model_preference', 'llama3.2:latest')
+        memory_opt_in = request.form.get('memory_enabled') == 'on'
         
-        if session.get('is_root'):
-            # Update root user preferences (you could extend this)
-            flash("Settings updated!", "success")
-        else:
-            for user in users[1]['users']:
-                if user['username'] == username:
-                    user['model_preference'] = model_preference
-                    break
+        generation_options = parse_generation_options(request.form)
+        
+        with state.lock('users'):
+            users = load_users()
+            if session.get('is_root'):
+                # Root stores no model preference for now (you could extend this)
+                users[0]['memory_enabled'] = memory_opt_in
+                users[0]['generation_options'] = generation_options
+            else:
+                for user in users[1]['users']:
+                    if user['username'] == username:
+                        user['model_preference'] = model_preference
+                        user['memory_enabled'] = memory_opt_in
+                        user['generation_options'] = generation_options
+                        break
             save_users(users)
-            flash("Settings updated!", "success")
+        flash("Settings updated!", "success")
         
         return redirect(url_for('settings'))
     
@@ -567,19 +1347,28 @@ def settings():
                 user_data = u
                 break
     else:
-        user_data = {"model_preference": "llama3.2:latest"}
+        user_data = {
+            "model_preference": "llama3.2:latest",
+            "memory_enabled": users[0].get('memory_enabled', False),
+            "generation_options": users[0].get('generation_options', {})
+        }
     
     # Get downloaded models for settings
     downloaded_models = get_ollama_models()
+    role = "root" if session.get('is_root') else "user"
+    role_caps = load_settings()['generation_caps']['roles'].get(role, {})
     
-    return render_template('settings.html', user_data=user_data, downloaded_models=downloaded_models, app_version=app_version)
+    return render_template('settings.html', user_data=user_data, downloaded_models=downloaded_models,
+                           role_caps=role_caps, app_version=app_version)
 
 @app.route('/logout')
 @login_required
 def logout():
     session.clear()
     flash("Logged out successfully.", "info")
-    return redirect(url_for('login'))
+    response = redirect(url_for('login'))
+    response.delete_cookie(REMEMBER_COOKIE)
+    return response
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,148 @@
+"""
+Login hardening - bounded password hashing, throttling and remember-me tokens.
+
+Password hashes are deliberately slow (hundreds of ms of CPU), so at most
+`slots` of them run at once across all gunicorn workers on the node; extra
+logins wait briefly and then get a "busy" answer instead of eating the cores
+chat requests need. Throttling counters live in the shared counter store
+(SQLite or Redis, see ratelimit.py) and are checked before any hashing.
+"""
+
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class LoginBusy(Exception):
+    """No hashing slot became free in time"""
+
+
+def canonical_method(method):
+    """Spell out Werkzeug's defaults so stored hashes compare against the configured cost"""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        args = (args + ['sha256'])[:1] + (args[1:] or [str(DEFAULT_PBKDF2_ITERATIONS)])
+    elif name == 'scrypt' and not args:
+        args = ['32768', '8', '1']
+    return ':'.join([name] + args)
+
+
+class PasswordHasher:
+    """Hash/verify passwords on a node-wide pool of `slots` concurrent hashes"""
+
+    def __init__(self, lock_dir, slots=2, method='pbkdf2:sha256', timeout=5):
+        self.lock_dir = lock_dir
+        self.slots = max(1, int(slots))
+        self.method = canonical_method(method)
+        self.timeout = timeout
+        os.makedirs(lock_dir, exist_ok=True)
+
+    @contextmanager
+    def _slot(self):
+        deadline = time.monotonic() + self.timeout
+        start = os.getpid() % self.slots  # spread workers over the slots
+        while True:
+            for i in range(self.slots):
+                handle = open(os.path.join(self.lock_dir, f"hash-slot-{(start + i) % self.slots}.lock"), 'a')
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    handle.close()
+                    continue
+                try:
+                    yield
+                finally:
+                    handle.close()
+                return
+            if time.monotonic() >= deadline:
+                raise LoginBusy()
+            time.sleep(0.05)
+
+    def hash(self, password):
+        with self._slot():
+            return generate_password_hash(password, method=self.method)
+
+    def verify(self, password_hash, password):
+        with self._slot():
+            return check_password_hash(password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return canonical_method(password_hash.split('$', 1)[0]) != self.method
+
+
+class LoginThrottle:
+    """Attempts per IP per minute and failed attempts per (username, IP) per window.
+
+    Failures are counted per address so nobody can lock an account out for everyone
+    else; `account_failures` is a much higher per-account ceiling across all addresses
+    against distributed guessing (0 turns it off).
+    """
+
+    def __init__(self, store, ip_per_minute=20, user_failures=10, user_window=900, account_failures=200):
+        self.store = store
+        self.ip_per_minute = ip_per_minute
+        self.user_failures = user_failures
+        self.user_window = user_window
+        self.account_failures = account_failures
+
+    def _window(self):
+        return int(time.time() // self.user_window)
+
+    def _user_key(self, username, ip):
+        return f"login:fail:{username}:{ip}:{self._window()}"
+
+    def _account_key(self, username):
+        return f"login:fail:{username}:{self._window()}"
+
+    def check(self, ip, username):
+        """Count an attempt; returns an error message if it should be rejected"""
+        minutes = self.user_window // 60
+        if self.user_failures and self.store.get(self._user_key(username, ip)) >= self.user_failures:
+            return f"Too many failed logins for this account. Try again in {minutes} minutes."
+        if self.account_failures and self.store.get(self._account_key(username)) >= self.account_failures:
+            return f"This account is temporarily locked after too many failed logins. Try again in {minutes} minutes."
+        if self.ip_per_minute:
+            count = self.store.incr(f"login:ip:{ip}:{int(time.time() // 60)}", 1, ttl=120)
+            if count > self.ip_per_minute:
+                return "Too many login attempts. Please wait a minute."
+        return None
+
+    def record_failure(self, username, ip):
+        if self.user_failures:
+            self.store.incr(self._user_key(username, ip), 1, ttl=self.user_window * 2)
+        if self.account_failures:
+            self.store.incr(self._account_key(username), 1, ttl=self.user_window * 2)
+
+
+class RememberTokens:
+    """Signed, expiring remember-me tokens bound to the user's current password hash"""
+
+    def __init__(self, secret_key, max_age_days=30):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='remember-me')
+        self.max_age = max_age_days * 86400
+
+    @staticmethod
+    def _fingerprint(password_hash):
+        # Changing (or rehashing) the password invalidates outstanding tokens
+        return hashlib.sha256(password_hash.encode('utf-8')).hexdigest()[:16]
+
+    def issue(self, username, password_hash):
+        return self.serializer.dumps({'u': username, 'p': self._fingerprint(password_hash)})
+
+    def load(self, token):
+        """(username, fingerprint) from a valid token, or None"""
+        try:
+            data = self.serializer.loads(token, max_age=self.max_age)
+        except BadSignature:
+            return None
+        if not isinstance(data, dict) or 'u' not in data or 'p' not in data:
+            return None
+        return data['u'], data['p']
+
+    def matches(self, fingerprint, password_hash):
+        return fingerprint == self._fingerprint(password_hash)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Offline batch inference over JSONL prompt files.
+
+    python batch.py prompts.jsonl -o results.jsonl --model llama3.2:latest
+
+Each input line is a JSON object with a "prompt" (or a full "messages" list)
+and optionally "id", "system", "model" and "options". Results are appended to
+the output as they finish, one JSON object per line tagged with the input line
+number. Re-running into the same output resumes: successful lines are kept,
+failed or missing ones are run again.
+
+Prompts are routed and capped like interactive chats (OLLAMA_HOSTS, root
+generation caps), run with a fixed number of requests in flight per backend,
+and hold back while chat requests are in flight on that backend. The root
+dashboard runs the same jobs from an uploaded file.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+
+class BatchJob:
+    def __init__(self, input_path, output_path, model, generate, route, build_options,
+                 is_busy=None, concurrency=2, status_path=None, max_yield=30):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.model = model
+        self.generate = generate            # (messages, model, options, host) -> {"content","tokens"} | {"error"}
+        self.route = route                  # prompt key -> backend host
+        self.build_options = build_options  # (model, requested options) -> capped options
+        self.is_busy = is_busy              # host -> True while interactive requests are running there
+        self.concurrency = max(1, int(concurrency))
+        self.status_path = status_path
+        self.max_yield = max_yield
+        self.status = {}
+        self._lock = threading.Lock()
+        self._out = None
+
+    # Checkpoint
+    def _load_done(self):
+        """Keep only successful records from a previous run; returns their line numbers"""
+        done, kept = set(), []
+        if os.path.exists(self.output_path):
+            with open(self.output_path, 'r') as f:
+                for raw in f:
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    if 'error' not in record and record.get('line') not in done:
+                        done.add(record['line'])
+                        kept.append(json.dumps(record) + '\n')
+            tmp = f"{self.output_path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                f.writelines(kept)
+            os.replace(tmp, self.output_path)
+        return done
+
+    def _save_status(self, **fields):
+        self.status.update(fields)
+        if not self.status_path:
+            return
+        tmp = f"{self.status_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.status, f, indent=2)
+        os.replace(tmp, self.status_path)
+
+    # Input
+    def _items(self):
+        with open(self.input_path, 'r', encoding='utf-8') as f:
+            for line_no, raw in enumerate(f, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    item = json.loads(raw)
+                except ValueError as e:
+                    yield line_no, None, f"Invalid JSON: {e}"
+                    continue
+                if isinstance(item, str):
+                    item = {'prompt': item}
+                if not isinstance(item, dict) or not (item.get('prompt') or isinstance(item.get('messages'), list)):
+                    yield line_no, None, "Line needs a \"prompt\" or a \"messages\" list"
+                elif not (item.get('model') or self.model):
+                    yield line_no, None, "No model given for this line and no default --model"
+                else:
+                    yield line_no, item, None
+
+    @staticmethod
+    def _messages(item):
+        if isinstance(item.get('messages'), list):
+            messages = list(item['messages'])
+        else:
+            messages = [{'role': 'user', 'content': str(item['prompt'])}]
+        if item.get('system'):
+            messages.insert(0, {'role': 'system', 'content': str(item['system'])})
+        return messages
+
+    # Output
+    def _write(self, record):
+        with self._lock:
+            self._out.write(json.dumps(record) + '\n')
+            self._out.flush()
+            if 'error' in record:
+                self.status['failed'] += 1
+            else:
+                self.status['done'] += 1
+                self.status['tokens'] += record.get('tokens', 0)
+            self._save_status()
+
+    # Execution
+    def _wait_for_turn(self, host):
+        """Hold back while chats are being answered on this backend (bounded, so a stuck counter can't stall the job)"""
+        waited = 0
+        while self.is_busy and waited < self.max_yield and self.is_busy(host):
+            time.sleep(0.5)
+            waited += 0.5
+
+    def _process(self, line_no, item, host):
+        model = item.get('model') or self.model
+        record = {'line': line_no, 'id': item.get('id'), 'model': model, 'host': host}
+        started = time.monotonic()
+        try:
+            self._wait_for_turn(host)
+            options = self.build_options(model, item.get('options'))
+            result = self.generate(self._messages(item), model, options, host)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        record['elapsed_s'] = round(time.monotonic() - started, 2)
+        if 'error' in result:
+            record['error'] = result['error']
+        else:
+            record['response'] = result['content']
+            record['tokens'] = result.get('tokens', 0)
+        self._write(record)
+
+    def _worker(self, host, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            self._process(job[0], job[1], host)
+
+    def run(self):
+        """Run (or resume) the job; raises RuntimeError if it is already running elsewhere"""
+        lock = open(self.output_path + '.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise RuntimeError(f"{self.output_path} is already being written by another batch run")
+
+        try:
+            if self.status_path and os.path.exists(self.status_path):
+                with open(self.status_path, 'r') as f:
+                    self.status = json.load(f)
+            done = self._load_done()
+            with open(self.input_path, 'r', encoding='utf-8') as f:
+                total = sum(1 for raw in f if raw.strip())
+            self._save_status(status='running', started_at=datetime.now().isoformat(), finished_at=None,
+                              total=total, done=len(done), resumed=len(done), failed=0, tokens=0)
+            print(f"📦 Batch {self.input_path}: {self.status['total']} prompts, {len(done)} already done")
+
+            self._out = open(self.output_path, 'a', encoding='utf-8')
+            queues, workers = {}, []
+            for line_no, item, error in self._items():
+                if line_no in done:
+                    continue
+                if error:
+                    self._write({'line': line_no, 'error': error})
+                    continue
+                host = self.route(f"{item.get('id', line_no)}")
+                if host not in queues:
+                    queues[host] = queue.Queue()
+                    for _ in range(self.concurrency):
+                        worker = threading.Thread(target=self._worker, args=(host, queues[host]), daemon=True)
+                        worker.start()
+                        workers.append(worker)
+                queues[host].put((line_no, item))
+            for jobs in queues.values():
+                for _ in range(self.concurrency):
+                    jobs.put(None)
+            for worker in workers:
+                worker.join()
+            self._save_status(status='finished', finished_at=datetime.now().isoformat())
+            print(f"✅ Batch {self.input_path}: {self.status['done']} done, {self.status['failed']} failed")
+        except Exception as e:
+            self._save_status(status='failed', error=str(e), finished_at=datetime.now().isoformat())
+            raise
+        finally:
+            if self._out:
+                self._out.close()
+            lock.close()
+        return self.status
+
+
+def is_running(output_path):
+    """True while some process holds the job's output lock"""
+    try:
+        with open(output_path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+    except BlockingIOError:
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a JSONL file of prompts through the local models')
+    parser.add_argument('input', help='JSONL file, one {"prompt": ...} or {"messages": [...]} per line')
+    parser.add_argument('-o', '--output', help='results JSONL (default: <input>.results.jsonl); reused to resume')
+    parser.add_argument('-m', '--model', help='model for lines that do not name one')
+    parser.add_argument('-c', '--concurrency', type=int, help='requests in flight per Ollama backend')
+    args = parser.parse_args()
+
+    # Same hosts, caps and chat in-flight counters as the web app
+    import app as webapp
+    output = args.output or os.path.splitext(args.input)[0] + '.results.jsonl'
+    job = webapp.make_batch_job(args.input, output, args.model,
+                                concurrency=args.concurrency or webapp.BATCH_CONCURRENCY)
+    job.run()
+    print(f"📄 Results: {output}")
+
+
+if __name__ == '__main__':
+    main()
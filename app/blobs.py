@@ -0,0 +1,103 @@
+"""
+Content-addressed store for large message bodies.
+
+Message content above `threshold` bytes is stored once per distinct text
+(sha256 of the UTF-8 bytes, zlib-compressed) through the state backend, and
+the chat keeps only {'blob': <digest>} in place of 'content'. Every stored
+message holds one reference, counted in the shared counter store; releasing
+the last one (delete_chat / clear_chat) deletes the blob.
+"""
+
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+REF_TTL = 10 * 365 * 86400
+MISSING_CONTENT = "[message content is no longer available]"
+
+
+class BlobStore:
+    def __init__(self, backend, threshold=4096, cache_bytes=16 * 1024 * 1024):
+        self.backend = backend
+        self.threshold = threshold
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _ref_key(digest):
+        return f"blobref:{digest}"
+
+    def _remember(self, digest, text):
+        size = len(text)
+        if size > self.cache_bytes:
+            return
+        with self._cache_lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return
+            self._cache[digest] = text
+            self._cache_size += size
+            while self._cache_size > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted)
+
+    def stash(self, message):
+        """Copy of `message` with large content replaced by a blob reference"""
+        content = message.get('content')
+        if not isinstance(content, str) or len(content) < self.threshold:
+            return message
+        data = content.encode('utf-8')
+        if len(data) < self.threshold:
+            return message
+        digest = hashlib.sha256(data).hexdigest()
+        # Same lock as release(), so a blob can't be collected between the check and the new reference
+        with self.backend.lock('blobs'):
+            if not self.backend.has_blob(digest):
+                self.backend.put_blob(digest, zlib.compress(data, 6))
+            self.backend.counters.incr(self._ref_key(digest), 1, ttl=REF_TTL)
+        self._remember(digest, content)
+        stored = {k: v for k, v in message.items() if k != 'content'}
+        stored['blob'] = digest
+        return stored
+
+    def retain(self, messages):
+        """Add a reference for each blob in messages that are now stored a second time"""
+        for message in messages:
+            if message.get('blob'):
+                self.backend.counters.incr(self._ref_key(message['blob']), 1, ttl=REF_TTL)
+
+    def release(self, messages):
+        """Drop the references held by removed messages; collect blobs nobody uses"""
+        digests = [m['blob'] for m in messages if m.get('blob')]
+        if not digests:
+            return
+        with self.backend.lock('blobs'):
+            for digest in digests:
+                # Exactly zero only - a negative count means lost bookkeeping, keep the data
+                if self.backend.counters.incr(self._ref_key(digest), -1, ttl=REF_TTL) == 0:
+                    self.backend.delete_blob(digest)
+                    with self._cache_lock:
+                        text = self._cache.pop(digest, None)
+                        if text is not None:
+                            self._cache_size -= len(text)
+
+    def get(self, digest):
+        with self._cache_lock:
+            text = self._cache.get(digest)
+            if text is not None:
+                self._cache.move_to_end(digest)
+                return text
+        data = self.backend.get_blob(digest)
+        if data is None:
+            print(f"⚠️  Missing message blob {digest}")
+            return MISSING_CONTENT
+        text = zlib.decompress(data).decode('utf-8')
+        self._remember(digest, text)
+        return text
+
+    def inflate(self, messages):
+        """Messages with blob references resolved back to their content"""
+        return [dict(m, content=self.get(m['blob'])) if m.get('blob') else m for m in messages]
@@ -0,0 +1,268 @@
+"""
+Hardware-aware model catalog.
+
+Detects what the node can run (RAM, swap, cores, AVX, GPU - the get_hw probe
+from old_app/ollama.sh, plus container limits), rates models against it
+(rate_model, adapted to real download sizes), and benchmarks downloaded models
+with a short fixed prompt to record prompt-eval and generation tokens/sec.
+Measured speed beats the estimate once a model has been calibrated.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+BENCHMARK_PROMPT = ("Explain in three short sentences why the sky is blue, "
+                    "then list three primary colors.")
+BENCHMARK_TOKENS = 64
+GB = 1024 ** 3
+# Architectures Ollama reports (/api/tags details) for embedding-only models
+EMBEDDING_FAMILIES = {'bert', 'nomic-bert', 'nomic-bert-moe', 'jina-bert-v2', 'xlm-roberta', 'roberta'}
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def _meminfo_gb(field):
+    match = re.search(rf'^{field}:\s+(\d+) kB', _read('/proc/meminfo'), re.M)
+    return int(match.group(1)) * 1024 / GB if match else 0
+
+
+def _cgroup_memory_gb():
+    """Container memory limit, if one is set (cgroup v2, then v1)"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        raw = _read(path).strip()
+        if raw.isdigit() and int(raw) < 1 << 60:
+            return int(raw) / GB
+    return None
+
+
+def _cgroup_cores():
+    raw = _read('/sys/fs/cgroup/cpu.max').split()
+    if len(raw) == 2 and raw[0].isdigit():
+        return max(1, int(raw[0]) // int(raw[1]))
+    quota, period = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us').strip(), _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us').strip()
+    if quota.isdigit() and period.isdigit() and int(period):
+        return max(1, int(quota) // int(period))
+    return None
+
+
+def _gpu():
+    try:
+        if shutil.which('nvidia-smi'):
+            out = subprocess.run(['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'],
+                                 capture_output=True, text=True, timeout=5).stdout.split()
+            return 'nvidia', round(float(out[0]) / 1024, 1) if out else 0
+        if shutil.which('rocm-smi'):
+            out = subprocess.run(['rocm-smi', '--showmeminfo', 'vram'], capture_output=True, text=True, timeout=5).stdout
+            match = re.search(r'Total VRAM.*?:\s*(\d+)', out)
+            return 'amd', round(int(match.group(1)) / GB, 1) if match else 0
+    except (OSError, subprocess.SubprocessError, ValueError):
+        pass
+    return 'none', 0
+
+
+def detect_hardware():
+    """RAM/swap in GB, usable cores, AVX flags and GPU of this node"""
+    mem_gb = _meminfo_gb('MemTotal')
+    limit_gb = _cgroup_memory_gb()
+    if limit_gb:
+        mem_gb = min(mem_gb, limit_gb) if mem_gb else limit_gb
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    cores = min(cores, _cgroup_cores() or cores)
+    flags_match = re.search(r'^flags\s*:(.*)$', _read('/proc/cpuinfo'), re.M)
+    flags = set(flags_match.group(1).split()) if flags_match else set()
+    gpu_type, gpu_vram_gb = _gpu()
+    return {
+        'mem_gb': round(mem_gb, 1),
+        'swap_gb': round(_meminfo_gb('SwapTotal'), 1),
+        'cores': cores,
+        'avx': 'avx' in flags,
+        'avx2': 'avx2' in flags,
+        'cpu_class': 'modern' if 'avx2' in flags else 'old',
+        'gpu_type': gpu_type,
+        'gpu_vram_gb': gpu_vram_gb,
+    }
+
+
+def parse_size(size):
+    """'4.7GB' / '900MB' -> bytes (catalog entries carry size strings)"""
+    match = re.match(r'\s*([\d.]+)\s*([KMGT]?)B', str(size or ''), re.I)
+    if not match:
+        return None
+    return int(float(match.group(1)) * 1024 ** ' KMGT'.index(match.group(2).upper() or ' '))
+
+
+def rate_model(size_bytes, hw, measured=None, slow_tps=5.0):
+    """fits / slow / wont_fit verdict with a short reason"""
+    if measured and measured.get('gen_tps'):
+        tps = measured['gen_tps']
+        if tps >= slow_tps:
+            return 'fits', f"Measured {tps:.1f} tok/s"
+        return 'slow', f"Measured {tps:.1f} tok/s - slow on this node"
+    if not size_bytes:
+        return 'unknown', "Size unknown"
+
+    size_gb = size_bytes / GB
+    need_gb = size_gb * 1.2 + 0.5  # weights + KV cache/runtime overhead
+    if hw['gpu_vram_gb'] >= need_gb:
+        verdict, note = 'fits', "Runs on GPU"
+    elif hw['mem_gb'] >= need_gb:
+        if size_gb <= 3:
+            verdict, note = 'fits', "Fast on CPU"
+        elif hw['cpu_class'] == 'modern' and hw['cores'] >= 8:
+            verdict, note = 'fits', "Reasonable on strong CPU"
+        else:
+            verdict, note = 'slow', "Possible on CPU"
+    elif hw['mem_gb'] + hw['swap_gb'] >= need_gb:
+        verdict, note = 'slow', "Needs swap"
+    else:
+        verdict, note = 'wont_fit', f"Needs ~{need_gb:.0f}GB RAM"
+    if not hw['avx'] and verdict != 'wont_fit':
+        verdict, note = 'slow', note + "; very slow without AVX"
+    return verdict, note
+
+
+def _tag(name):
+    return name if ':' in name else name + ':latest'
+
+
+class ModelCatalog:
+    """Node hardware + per-model benchmark results, shared by all workers via a JSON file"""
+
+    def __init__(self, path, ollama_host, slow_tps=5.0, embed_models=()):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.ollama_host = ollama_host
+        self.slow_tps = slow_tps
+        self.embed_models = {_tag(m) for m in embed_models if m}
+        self._hardware = None
+
+    def is_embedding(self, model):
+        """Embedding-only models (the memory model, BERT-style families, '*embed*' names) can't chat"""
+        families = set(model.get('families') or []) | {model.get('family')}
+        name = model['name']
+        return (_tag(name) in self.embed_models or bool(families & EMBEDDING_FAMILIES)
+                or 'embed' in name.split(':')[0].lower())
+
+    def hardware(self):
+        if self._hardware is None:
+            self._hardware = detect_hardware()
+        return self._hardware
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'models': {}}
+
+    def _save(self, data):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def benchmark_model(self, model):
+        """One short non-streamed generation; tokens/sec from Ollama's own timings"""
+        response = requests.post(f"{self.ollama_host}/api/generate", json={
+            "model": model,
+            "prompt": BENCHMARK_PROMPT,
+            "stream": False,
+            "options": {"num_predict": BENCHMARK_TOKENS, "temperature": 0, "seed": 0}
+        }, timeout=600)
+        if response.status_code != 200:
+            return {'error': f"HTTP {response.status_code} - {response.text[:200]}"}
+        data = response.json()
+
+        def rate(count, duration_ns):
+            return round(count / (duration_ns / 1e9), 1) if count and duration_ns else None
+
+        return {
+            'prompt_tps': rate(data.get('prompt_eval_count'), data.get('prompt_eval_duration')),
+            'gen_tps': rate(data.get('eval_count'), data.get('eval_duration')),
+            'load_s': round(data.get('load_duration', 0) / 1e9, 1),
+            'measured_at': datetime.now().isoformat()
+        }
+
+    def calibrate(self, models):
+        """Benchmark chat models one at a time (they compete for the same RAM); skips if already running"""
+        models = [m['name'] for m in models if not self.is_embedding(m)]
+        with open(self.lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            data = self.load()
+            data['hardware'] = self.hardware()
+            for model in models:
+                data['current'] = model
+                self._save(data)
+                started = time.monotonic()
+                try:
+                    result = self.benchmark_model(model)
+                except Exception as e:
+                    result = {'error': f"{type(e).__name__}: {e}"}
+                data['models'][model] = result
+                print(f"[CATALOG] {model}: {result} ({time.monotonic() - started:.1f}s)")
+            data.update(current=None, calibrated_at=datetime.now().isoformat())
+            self._save(data)
+        return True
+
+    def calibrating(self):
+        """Model being benchmarked right now (by any worker), or None"""
+        with open(self.lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return None
+            except BlockingIOError:
+                return self.load().get('current') or '...'
+
+    def calibrate_async(self, models):
+        threading.Thread(target=self.calibrate, args=(list(models),), name='model-calibration', daemon=True).start()
+
+    def annotate(self, models):
+        """Add verdict, note and measured speeds to [{'name', 'size'|'size_bytes'}, ...]"""
+        hw = self.hardware()
+        measured = self.load().get('models', {})
+        annotated = []
+        for model in models:
+            size_bytes = model.get('size_bytes') or parse_size(model.get('size'))
+            if self.is_embedding(model):
+                annotated.append(dict(model, size_bytes=size_bytes, verdict='embedding',
+                                      note="Embedding model - for conversation memory, not chat",
+                                      gen_tps=None, prompt_tps=None))
+                continue
+            result = measured.get(model['name'])
+            result = result if result and 'error' not in result else None
+            verdict, note = rate_model(size_bytes, hw, result, self.slow_tps)
+            annotated.append(dict(model, size_bytes=size_bytes, verdict=verdict, note=note,
+                                  gen_tps=result and result.get('gen_tps'),
+                                  prompt_tps=result and result.get('prompt_tps')))
+        return annotated
+
+    def recommend(self, models):
+        """Fastest measured model that fits, else the smallest one estimated to fit"""
+        annotated = [m for m in self.annotate(models) if m['verdict'] == 'fits']
+        measured = [m for m in annotated if m['gen_tps']]
+        if measured:
+            return max(measured, key=lambda m: m['gen_tps'])['name']
+        if annotated:
+            return min(annotated, key=lambda m: m['size_bytes'] or 0)['name']
+        return None
@@ -0,0 +1,171 @@
+"""
+Per-worker LRU cache of recently active chats.
+
+Chats are kept in a compact form (__slots__ records, interned role strings,
+16-byte ids, float timestamps) and the cache is bounded by an estimate of the
+bytes it holds rather than by entry count. Every write bumps a per-chat version
+counter in the shared counter store, so a worker notices on its next read that
+another worker (or replica) changed the chat and drops its copy.
+"""
+
+import copy
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+VERSION_TTL = 10 * 365 * 86400
+_ROLES = {role: sys.intern(role) for role in ('system', 'user', 'assistant')}
+_MESSAGE_KEYS = ('id', 'role', 'content', 'timestamp')
+
+
+def _pack_id(value):
+    try:
+        return uuid.UUID(value).bytes
+    except (TypeError, ValueError, AttributeError):
+        return value
+
+
+def _unpack_id(value):
+    return str(uuid.UUID(bytes=value)) if isinstance(value, bytes) else value
+
+
+def _pack_timestamp(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    # Only naive local timestamps (what the app writes) round-trip through a float
+    return parsed.timestamp() if parsed.tzinfo is None and parsed.isoformat() == value else value
+
+
+def _unpack_timestamp(value):
+    return datetime.fromtimestamp(value).isoformat() if isinstance(value, float) else value
+
+
+class CachedMessage:
+    __slots__ = ('id', 'role', 'content', 'ts', 'extra')
+
+    def __init__(self, message):
+        self.id = _pack_id(message.get('id'))
+        role = message.get('role')
+        self.role = _ROLES.get(role, role)
+        self.content = message.get('content')
+        self.ts = _pack_timestamp(message.get('timestamp'))
+        extra = {k: v for k, v in message.items() if k not in _MESSAGE_KEYS}
+        self.extra = extra or None
+
+    def to_dict(self):
+        message = {
+            'id': _unpack_id(self.id),
+            'role': self.role,
+            'content': self.content,
+            'timestamp': _unpack_timestamp(self.ts)
+        }
+        if self.content is None:
+            del message['content']
+        if self.extra:
+            message.update(self.extra)
+        return message
+
+    def nbytes(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.id) + sys.getsizeof(self.ts)
+        if self.content is not None:
+            size += sys.getsizeof(self.content)
+        if self.extra:
+            size += sys.getsizeof(self.extra) + sum(sys.getsizeof(v) for v in self.extra.values())
+        return size
+
+
+class CachedChat:
+    __slots__ = ('version', 'meta', 'messages', 'nbytes')
+
+    def __init__(self, chat, version):
+        self.version = version
+        self.meta = copy.deepcopy({k: v for k, v in chat.items() if k != 'messages'})
+        self.messages = tuple(CachedMessage(m) for m in chat.get('messages', []))
+        self.nbytes = (sys.getsizeof(self) + sys.getsizeof(self.meta) + sys.getsizeof(self.messages)
+                       + sum(sys.getsizeof(v) for v in self.meta.values())
+                       + sum(m.nbytes() for m in self.messages))
+
+    def to_dict(self):
+        chat = copy.deepcopy(self.meta)
+        chat['messages'] = [m.to_dict() for m in self.messages]
+        return chat
+
+
+class CachedChatBackend:
+    """Wraps a state backend; chat reads are served from memory when still current"""
+
+    def __init__(self, backend, max_bytes):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _version(self, chat_id):
+        return self.backend.counters.get(f"chatver:{chat_id}")
+
+    def _bump(self, chat_id):
+        return self.backend.counters.incr(f"chatver:{chat_id}", 1, ttl=VERSION_TTL)
+
+    def _drop(self, chat_id):
+        entry = self._entries.pop(chat_id, None)
+        if entry:
+            self._bytes -= entry.nbytes
+
+    def _store(self, chat, version):
+        entry = CachedChat(chat, version)
+        with self._lock:
+            self._drop(chat['id'])
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[chat['id']] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def get_chat(self, chat_id):
+        version = self._version(chat_id)
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(chat_id)
+                self.hits += 1
+                return entry.to_dict()
+            self.misses += 1
+        chat = self.backend.get_chat(chat_id)
+        if chat is not None:
+            self._store(chat, version)
+        return chat
+
+    def save_chat(self, chat):
+        self.backend.save_chat(chat)
+        self._store(chat, self._bump(chat['id']))
+
+    def delete_chat(self, chat_id):
+        self.backend.delete_chat(chat_id)
+        self._bump(chat_id)
+        with self._lock:
+            self._drop(chat_id)
+
+    def save_chats(self, chats):
+        self.backend.save_chats(chats)
+        for chat in chats:
+            self._bump(chat['id'])
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,107 @@
+"""
+Ollama health monitor - one probe per interval, shared by all gunicorn workers.
+
+Every worker runs a small background thread, but only the first one to grab
+the status file lock after it has gone stale actually talks to Ollama; the
+others just re-read the published snapshot. Dashboards read the snapshot and
+never trigger an upstream request themselves.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+
+class OllamaHealthMonitor:
+    def __init__(self, ollama_host, status_file, interval=10):
+        self.ollama_host = ollama_host
+        self.status_file = status_file
+        self.lock_file = status_file + '.lock'
+        self.interval = interval
+        self._status = {'connected': False, 'status': 'checking', 'host': ollama_host}
+        self._etag = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def probe(self):
+        """Query Ollama once and return a status snapshot"""
+        started = time.monotonic()
+        try:
+            response = requests.get(f"{self.ollama_host}/api/tags", timeout=2)
+            latency_ms = round((time.monotonic() - started) * 1000, 1)
+            if response.status_code != 200:
+                return {'connected': False, 'status': 'error', 'error': f'HTTP {response.status_code}',
+                        'host': self.ollama_host, 'latency_ms': latency_ms}
+            models = response.json().get('models', [])
+            loaded = []
+            try:
+                ps = requests.get(f"{self.ollama_host}/api/ps", timeout=2)
+                if ps.status_code == 200:
+                    loaded = [m['name'] for m in ps.json().get('models', [])]
+            except Exception:
+                pass
+            return {
+                'connected': True,
+                'status': 'online',
+                'models': len(models),
+                'model_names': [m['name'] for m in models],
+                'loaded': loaded,
+                'latency_ms': latency_ms,
+                'host': self.ollama_host
+            }
+        except Exception as e:
+            return {'connected': False, 'status': 'offline', 'error': str(e), 'host': self.ollama_host}
+
+    def refresh(self):
+        """Probe if the shared snapshot is stale, otherwise adopt it"""
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshot = self._read_snapshot()
+            if snapshot is None or time.time() - snapshot.get('checked_at', 0) >= self.interval:
+                snapshot = self.probe()
+                snapshot['checked_at'] = time.time()
+                tmp = f"{self.status_file}.{os.getpid()}.tmp"
+                with open(tmp, 'w') as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, self.status_file)
+        self._publish(snapshot)
+        return snapshot
+
+    def _read_snapshot(self):
+        try:
+            with open(self.status_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, snapshot):
+        # ETag ignores the probe time so an unchanged status revalidates as 304
+        stable = {k: v for k, v in snapshot.items() if k not in ('checked_at', 'latency_ms')}
+        etag = hashlib.sha1(json.dumps(stable, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self._status, self._etag = snapshot, etag
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[HEALTH] Refresh failed: {type(e).__name__}: {str(e)}")
+            time.sleep(self.interval)
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ollama-health', daemon=True)
+                self._thread.start()
+
+    def current(self):
+        """Latest snapshot and its ETag (starts the monitor on first use)"""
+        if self._thread is None:
+            self.start()
+            self.refresh()
+        return self._status, self._etag
@@ -0,0 +1,333 @@
+"""
+Conversation memory - per-user embedding index over past chat messages.
+
+Messages are embedded through Ollama's /api/embed endpoint by a background
+thread (in batches) and appended to a compact float32 matrix on disk that is
+memory-mapped for search. Each user gets their own directory:
+
+    <root>/<user-hash>/vectors.f32   - row-major float32, L2-normalised
+    <root>/<user-hash>/entries.jsonl - one line per row (chat id, role, snippet);
+                                       only line offsets are kept in memory
+    <root>/<user-hash>/meta.json     - embedding model + dimension
+    <root>/<user-hash>/forgotten.json - chat ids removed by delete/clear
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+import requests
+
+SNIPPET_CHARS = 500     # Text kept per entry for prompt injection
+BATCH_SIZE = 32         # Max messages per /api/embed call
+BATCH_WAIT = 1.0        # Seconds to wait for a batch to fill up
+MAX_OPEN_INDEXES = 256  # Per-user indexes kept open per worker (least recently used are closed)
+SCAN_CHUNK = 1 << 20
+
+
+def _user_key(username):
+    return hashlib.sha256(username.encode('utf-8')).hexdigest()[:16]
+
+
+class MemoryIndex:
+    """Append-only vector index for one user"""
+
+    def __init__(self, root_dir, username):
+        self.dir = os.path.join(root_dir, _user_key(username))
+        self.vectors_path = os.path.join(self.dir, 'vectors.f32')
+        self.entries_path = os.path.join(self.dir, 'entries.jsonl')
+        self.meta_path = os.path.join(self.dir, 'meta.json')
+        self.forgotten_path = os.path.join(self.dir, 'forgotten.json')
+        self.lock_path = os.path.join(self.dir, '.lock')
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._mutex = threading.Lock()
+        self._meta = None
+        self._matrix = None
+        self._matrix_size = -1
+        self._line_starts = array('q')   # Byte offset of each complete entries.jsonl line
+        self._entries_offset = 0         # End of the last complete line
+        self._forgotten = set()
+        self._forgotten_mtime = None
+
+    def _file_lock(self):
+        handle = open(self.lock_path, 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _load_meta(self):
+        if self._meta is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def add(self, vectors, entries):
+        """Append normalised vectors and their entries (same length)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        handle = self._file_lock()
+        try:
+            meta = self._load_meta()
+            if meta is None:
+                meta = {"dim": int(vectors.shape[1]), "model": entries[0].get('model')}
+                with open(self.meta_path, 'w') as f:
+                    json.dump(meta, f)
+                self._meta = meta
+            if vectors.shape[1] != meta['dim']:
+                print(f"[MEMORY] Dimension mismatch ({vectors.shape[1]} != {meta['dim']}), skipping batch")
+                return
+            with self._mutex:
+                self._repair(meta['dim'])
+            # Vectors first, entries second: readers only trust rows that have an entry
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self.entries_path, 'a') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + '\n')
+        finally:
+            handle.close()
+
+    def _scan_entries(self):
+        """Record offsets of entry lines appended since the last scan (no JSON decoding)"""
+        if not os.path.exists(self.entries_path):
+            self._line_starts, self._entries_offset = array('q'), 0
+            return
+        size = os.path.getsize(self.entries_path)
+        if size < self._entries_offset:
+            # Rows we already counted were cut by _repair() in another worker; start over
+            self._line_starts, self._entries_offset = array('q'), 0
+        if size == self._entries_offset:
+            return
+        with open(self.entries_path, 'rb') as f:
+            f.seek(self._entries_offset)
+            pending = b''
+            while True:
+                chunk = f.read(SCAN_CHUNK)
+                if not chunk:
+                    break
+                data = pending + chunk
+                base = self._entries_offset
+                ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+                if len(ends):
+                    starts = np.concatenate(([0], ends[:-1] + 1)) + base
+                    self._line_starts.extend(starts.tolist())
+                    self._entries_offset = base + int(ends[-1]) + 1
+                    pending = data[int(ends[-1]) + 1:]
+                else:
+                    pending = data
+
+    def _repair(self, dim):
+        """Cut both files back to the rows they agree on (a writer died mid-append).
+        Call under the file lock and the mutex; only reads what was appended since the last call."""
+        self._scan_entries()
+        entry_rows = len(self._line_starts)
+        row_bytes = dim * 4
+        vector_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = min(entry_rows, vector_size // row_bytes)
+        if rows < entry_rows:
+            self._entries_offset = self._line_starts[rows]
+            del self._line_starts[rows:]
+        entries_end = self._entries_offset
+        entries_size = os.path.getsize(self.entries_path) if os.path.exists(self.entries_path) else 0
+        if entries_size != entries_end:
+            print(f"[MEMORY] Dropping {entries_size - entries_end} torn bytes from {self.entries_path}")
+            with open(self.entries_path, 'r+b') as f:
+                f.truncate(entries_end)
+        if vector_size != rows * row_bytes:
+            print(f"[MEMORY] Truncating {self.vectors_path} to {rows} rows")
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(rows * row_bytes)
+
+    def forget_chat(self, chat_id):
+        """Hide every entry of a chat from future searches"""
+        handle = self._file_lock()
+        try:
+            forgotten = set()
+            if os.path.exists(self.forgotten_path):
+                with open(self.forgotten_path, 'r') as f:
+                    forgotten = set(json.load(f))
+            forgotten.add(chat_id)
+            with open(self.forgotten_path, 'w') as f:
+                json.dump(sorted(forgotten), f)
+        finally:
+            handle.close()
+
+    def _refresh(self):
+        """Pick up rows appended by any worker since the last search"""
+        self._scan_entries()
+
+        meta = self._load_meta()
+        if meta and os.path.exists(self.vectors_path):
+            size = os.path.getsize(self.vectors_path)
+            if size != self._matrix_size:
+                rows = size // (meta['dim'] * 4)
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, meta['dim'])) if rows else None
+                self._matrix_size = size
+
+        if os.path.exists(self.forgotten_path):
+            mtime = os.path.getmtime(self.forgotten_path)
+            if mtime != self._forgotten_mtime:
+                with open(self.forgotten_path, 'r') as f:
+                    self._forgotten = set(json.load(f))
+                self._forgotten_mtime = mtime
+
+    def search(self, query_vector, k=3, exclude_chat=None, min_score=0.0):
+        """Return the top-k entries by cosine similarity"""
+        with self._mutex:
+            self._refresh()
+            if self._matrix is None:
+                return []
+            rows = min(len(self._matrix), len(self._line_starts))
+            if rows == 0:
+                return []
+
+            query = np.asarray(query_vector, dtype=np.float32)
+            if query.shape[0] != self._matrix.shape[1]:
+                return []
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            scores = self._matrix[:rows] @ query
+
+            # Over-fetch so filtered entries don't starve the result
+            fetch = min(rows, k * 4 + 8)
+            top = np.argpartition(-scores, fetch - 1)[:fetch]
+            top = top[np.argsort(-scores[top])]
+
+            # Only the candidates' entries are read from disk
+            results = []
+            with open(self.entries_path, 'rb') as f:
+                for i in top:
+                    score = float(scores[i])
+                    if score < min_score:
+                        break
+                    f.seek(self._line_starts[i])
+                    entry = json.loads(f.readline())
+                    if entry['chat_id'] == exclude_chat or entry['chat_id'] in self._forgotten:
+                        continue
+                    results.append(dict(entry, score=score))
+                    if len(results) >= k:
+                        break
+            return results
+
+    def __len__(self):
+        with self._mutex:
+            self._refresh()
+            return len(self._line_starts)
+
+
+class MemoryStore:
+    """Embeds messages in the background and serves per-user searches"""
+
+    def __init__(self, root_dir, ollama_host, model):
+        self.root_dir = root_dir
+        self.ollama_host = ollama_host
+        self.model = model
+        self._indexes = OrderedDict()
+        self._indexes_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        os.makedirs(root_dir, exist_ok=True)
+
+    def index_for(self, username):
+        with self._indexes_lock:
+            index = self._indexes.get(username)
+            if index is None:
+                index = self._indexes[username] = MemoryIndex(self.root_dir, username)
+                if len(self._indexes) > MAX_OPEN_INDEXES:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(username)
+            return index
+
+    def embed(self, texts, timeout=30):
+        """Embed a list of texts, returns a list of vectors or None on failure"""
+        try:
+            response = requests.post(
+                f"{self.ollama_host}/api/embed",
+                json={"model": self.model, "input": texts},
+                timeout=timeout
+            )
+            if response.status_code == 200:
+                return response.json().get('embeddings')
+            print(f"[MEMORY] Embed error: {response.status_code} - {response.text}")
+        except Exception as e:
+            print(f"[MEMORY] Embed exception: {type(e).__name__}: {str(e)}")
+        return None
+
+    def enqueue(self, username, chat_id, message):
+        """Queue a saved message for background embedding"""
+        content = message.get('content', '').strip()
+        if not content:
+            return
+        self._ensure_worker()
+        self._queue.put((username, {
+            "chat_id": chat_id,
+            "message_id": message.get('id'),
+            "role": message.get('role'),
+            "snippet": content[:SNIPPET_CHARS],
+            "timestamp": message.get('timestamp'),
+            "model": self.model,
+        }, content))
+
+    def search(self, username, query, k=3, exclude_chat=None, min_score=0.3):
+        """Embed the query and return the user's top-k matching snippets"""
+        vectors = self.embed([query], timeout=10)
+        if not vectors:
+            return []
+        return self.index_for(username).search(vectors[0], k=k, exclude_chat=exclude_chat, min_score=min_score)
+
+    def forget_chat(self, username, chat_id):
+        self.index_for(username).forget_chat(chat_id)
+
+    def _ensure_worker(self):
+        # Started lazily so each gunicorn worker gets its own thread after fork
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='memory-embedder', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_WAIT
+            while len(batch) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"[MEMORY] Batch failed: {type(e).__name__}: {str(e)}")
+
+    def _process(self, batch):
+        vectors = self.embed([text for _, _, text in batch])
+        if not vectors or len(vectors) != len(batch):
+            return
+        by_user = {}
+        for (username, entry, _), vector in zip(batch, vectors):
+            rows = by_user.setdefault(username, ([], []))
+            rows[0].append(vector)
+            rows[1].append(entry)
+        for username, (user_vectors, entries) in by_user.items():
+            self.index_for(username).add(user_vectors, entries)
+
+
+def format_memory_prompt(snippets):
+    """Build the system message injected ahead of the conversation"""
+    lines = ["Relevant excerpts from the user's earlier conversations (use only if helpful):"]
+    for s in snippets:
+        lines.append(f"- [{s['role']}] {s['snippet']}")
+    return "\n".join(lines)
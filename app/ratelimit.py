@@ -0,0 +1,127 @@
+"""
+Per-user rate limiting and daily token quotas shared by all gunicorn workers.
+
+Counters live in a small SQLite database next to the other data files, or in
+Redis (any Redis-protocol server) - the state backend in storage.py picks one.
+Both stores expose the same incr/get API so the limiter doesn't care which.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class SQLiteCounterStore:
+    """Expiring integer counters in a local SQLite file (WAL, multi-process safe)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                " key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def incr(self, key, amount=1, ttl=60):
+        """Add `amount`; every update pushes the expiry to `ttl` seconds from now"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM counters WHERE key = ? AND expires_at <= ?", (key, now))
+            conn.execute(
+                "INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value, expires_at = excluded.expires_at",
+                (key, amount, now + ttl)
+            )
+            value = conn.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM counters WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def purge(self):
+        self._connect().execute("DELETE FROM counters WHERE expires_at <= ?", (time.time(),))
+
+
+class RedisCounterStore:
+    """Same API on top of a Redis-protocol server"""
+
+    def __init__(self, client, prefix=''):
+        self.client = client
+        self.prefix = prefix
+
+    def incr(self, key, amount=1, ttl=60):
+        key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.incrby(key, amount)
+        pipe.expire(key, ttl)
+        return int(pipe.execute()[0])
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    def purge(self):
+        pass  # Redis expires keys itself
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-day limits keyed by username"""
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def _minute_key(username):
+        return f"rl:req:{username}:{int(time.time() // 60)}"
+
+    @staticmethod
+    def _day_key(username):
+        return f"rl:tok:{username}:{datetime.now(timezone.utc):%Y%m%d}"
+
+    def check(self, username, limits):
+        """Count a request; returns an error message if it should be rejected"""
+        tokens_per_day = limits.get('tokens_per_day')
+        if tokens_per_day and self.store.get(self._day_key(username)) >= tokens_per_day:
+            return "Daily token quota used up. It resets at midnight UTC."
+
+        requests_per_minute = limits.get('requests_per_minute')
+        if requests_per_minute:
+            count = self.store.incr(self._minute_key(username), 1, ttl=120)
+            if count > requests_per_minute:
+                return f"Rate limit reached ({requests_per_minute} requests per minute). Please wait a moment."
+        return None
+
+    def record_tokens(self, username, tokens):
+        if tokens > 0:
+            self.store.incr(self._day_key(username), tokens, ttl=2 * 86400)
+
+    def usage(self, username, limits):
+        tokens_today = self.store.get(self._day_key(username))
+        tokens_per_day = limits.get('tokens_per_day')
+        return {
+            "requests_this_minute": self.store.get(self._minute_key(username)),
+            "requests_per_minute": limits.get('requests_per_minute'),
+            "tokens_today": tokens_today,
+            "tokens_per_day": tokens_per_day,
+            "tokens_remaining": max(tokens_per_day - tokens_today, 0) if tokens_per_day else None,
+        }
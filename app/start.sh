@@ -1,5 +1,7 @@
 #!/bin/bash
-./ollama serve > /tmp/ollama.log 2>&1 &
-sleep 5
-gunicorn -w 4 -b 0.0.0.0:5000 --timeout 600 --log-level info wsgi:app
-
+ollama serve > /tmp/ollama.log 2>&1 &
+python warmup.py wait || echo "⚠️  Starting anyway - /readyz reports not ready until Ollama answers"
+if [ -n "$PRELOAD_MODEL" ]; then
+    python warmup.py preload "$PRELOAD_MODEL" &
+fi
+exec gunicorn -w 4 -k gthread --threads 4 --keep-alive 75 -b 0.0.0.0:5000 --timeout 600 --preload --log-level info wsgi:app
@@ -0,0 +1,171 @@
+const chatId = document.body.dataset.chatId;
+const messagesContainer = document.getElementById('messagesContainer');
+const messageInput = document.getElementById('messageInput');
+const sendButton = document.getElementById('sendButton');
+const typingIndicator = document.getElementById('typingIndicatorContainer');
+
+function scrollToBottom() {
+  messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function handleKeyPress(event) {
+  if (event.key === 'Enter' && !event.shiftKey) {
+    event.preventDefault();
+    sendMessage();
+  }
+}
+
+function useSuggestion(text) {
+  messageInput.value = text;
+  messageInput.focus();
+}
+
+async function sendMessage() {
+  const message = messageInput.value.trim();
+  if (!message) return;
+
+  // Disable input
+  messageInput.disabled = true;
+  sendButton.disabled = true;
+
+  // Clear input
+  messageInput.value = '';
+
+  // Add user message to UI
+  const userDiv = addMessageToUI('user', message);
+
+  // Show typing indicator
+  typingIndicator.style.display = 'flex';
+  scrollToBottom();
+
+  try {
+    const response = await fetch(`/chat/${chatId}/message`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ message: message })
+    });
+
+    const data = await response.json();
+
+    // Hide typing indicator
+    typingIndicator.style.display = 'none';
+
+    if (response.ok) {
+      // Add assistant message to UI
+      setMessageActions(userDiv, data.user_message.id);
+      addMessageToUI('assistant', data.message.content, data.message.id);
+    } else {
+      const errorMsg = data.error || 'Failed to send message';
+      addMessageToUI('assistant', '❌ Error: ' + errorMsg + '\n\nMake sure Ollama is running (ollama serve) and the model is downloaded.');
+    }
+  } catch (error) {
+    typingIndicator.style.display = 'none';
+    addMessageToUI('assistant', '❌ Connection Error: ' + error.message + '\n\nMake sure Ollama is running on your system.');
+  } finally {
+    // Re-enable input
+    messageInput.disabled = false;
+    sendButton.disabled = false;
+    messageInput.focus();
+  }
+}
+
+function forkAt(messageId) {
+  const form = document.createElement('form');
+  form.method = 'POST';
+  form.action = `/chat/${chatId}/fork`;
+  const input = document.createElement('input');
+  input.type = 'hidden';
+  input.name = 'message_id';
+  input.value = messageId;
+  form.appendChild(input);
+  document.body.appendChild(form);
+  form.submit();
+}
+
+async function editMessage(messageId) {
+  const messageDiv = messagesContainer.querySelector(`[data-message-id="${messageId}"]`);
+  const current = messageDiv ? messageDiv.querySelector('.content').textContent : '';
+  const edited = prompt('Edit message (the reply is regenerated on a new branch):', current);
+  if (edited === null || !edited.trim()) return;
+
+  typingIndicator.style.display = 'flex';
+  scrollToBottom();
+  try {
+    const response = await fetch(`/chat/${chatId}/edit`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ message_id: messageId, message: edited.trim() })
+    });
+    const data = await response.json();
+    if (data.chat_id) {
+      window.location.href = `/chat/${data.chat_id}`;
+      return;
+    }
+    typingIndicator.style.display = 'none';
+    addMessageToUI('assistant', '❌ Error: ' + (data.error || 'Failed to edit message'));
+  } catch (error) {
+    typingIndicator.style.display = 'none';
+    addMessageToUI('assistant', '❌ Connection Error: ' + error.message);
+  }
+}
+
+function setMessageActions(messageDiv, messageId) {
+  messageDiv.dataset.messageId = messageId;
+  const actions = document.createElement('div');
+  actions.className = 'message-actions';
+  if (messageDiv.classList.contains('user')) {
+    const edit = document.createElement('button');
+    edit.textContent = '✏️';
+    edit.title = 'Edit and regenerate on a new branch';
+    edit.onclick = () => editMessage(messageId);
+    actions.appendChild(edit);
+  }
+  const fork = document.createElement('button');
+  fork.textContent = '⑂';
+  fork.title = 'Branch from here';
+  fork.onclick = () => forkAt(messageId);
+  actions.appendChild(fork);
+  messageDiv.appendChild(actions);
+}
+
+function addMessageToUI(role, content, messageId) {
+  // Remove empty state if it exists
+  const emptyState = messagesContainer.querySelector('.empty-state');
+  if (emptyState) {
+    emptyState.remove();
+  }
+
+  const messageDiv = document.createElement('div');
+  messageDiv.className = `message ${role}`;
+  
+  const avatar = document.createElement('div');
+  avatar.className = 'avatar';
+  avatar.textContent = role === 'user' ? '👤' : '🤖';
+  
+  const contentDiv = document.createElement('div');
+  contentDiv.className = 'content';
+  contentDiv.textContent = content;
+  
+  messageDiv.appendChild(avatar);
+  messageDiv.appendChild(contentDiv);
+  if (messageId) {
+    setMessageActions(messageDiv, messageId);
+  }
+  
+  messagesContainer.insertBefore(messageDiv, typingIndicator);
+  scrollToBottom();
+  return messageDiv;
+}
+
+// Auto-resize textarea
+messageInput.addEventListener('input', function() {
+  this.style.height = 'auto';
+  this.style.height = (this.scrollHeight) + 'px';
+});
+
+// Initial scroll
+scrollToBottom();
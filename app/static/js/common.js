@@ -0,0 +1,13 @@
+function showPopup(message, category = 'success') {
+  const popup = document.getElementById('notificationPopup');
+  popup.textContent = message;
+  popup.className = 'popup show ' + category;
+  setTimeout(() => popup.classList.remove('show'), 3000);
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+  const flashes = document.getElementById('flashMessages');
+  if (flashes) {
+    JSON.parse(flashes.textContent).forEach(([category, message]) => showPopup(message, category));
+  }
+});
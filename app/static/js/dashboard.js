@@ -0,0 +1,119 @@
+function openNewChatModal() {
+  document.getElementById('newChatModal').style.display = 'block';
+}
+
+function closeNewChatModal() {
+  document.getElementById('newChatModal').style.display = 'none';
+}
+
+function viewChat(chatId) {
+  window.location.href = `/chat/${chatId}`;
+}
+
+function downloadModel(modelName) {
+  const safeId = modelName.replace(/:/g, '-').replace(/\./g, '-');
+  const progressDiv = document.getElementById(`progress-${safeId}`);
+  const progressFill = document.getElementById(`progress-fill-${safeId}`);
+  const progressText = document.getElementById(`progress-text-${safeId}`);
+  const button = event.target.closest('button');
+  const btnText = button.querySelector('.btn-text');
+  const spinner = button.querySelector('.spinner');
+  
+  // Disable button and show spinner
+  button.disabled = true;
+  btnText.style.display = 'none';
+  spinner.style.display = 'inline';
+  progressDiv.style.display = 'block';
+  
+  // Use EventSource for server-sent events
+  const eventSource = new EventSource(`/model/download/${encodeURIComponent(modelName)}`);
+  
+  eventSource.onmessage = function(event) {
+    try {
+      const data = JSON.parse(event.data);
+      
+      if (data.error) {
+        showPopup(data.error, 'danger');
+        eventSource.close();
+        button.disabled = false;
+        btnText.style.display = 'inline';
+        spinner.style.display = 'none';
+        progressDiv.style.display = 'none';
+        return;
+      }
+      
+      if (data.status === 'complete' || data.status === 'success') {
+        showPopup(`Model ${modelName} downloaded successfully! Reloading...`, 'success');
+        eventSource.close();
+        setTimeout(() => location.reload(), 1500);
+        return;
+      }
+      
+      // Update progress if available
+      if (data.completed && data.total) {
+        const percent = Math.round((data.completed / data.total) * 100);
+        progressFill.style.width = percent + '%';
+        progressText.textContent = percent + '%';
+      } else if (data.status) {
+        progressText.textContent = data.status;
+      }
+    } catch (e) {
+      console.error('Error parsing event data:', e);
+    }
+  };
+  
+  eventSource.onerror = function(error) {
+    console.error('EventSource error:', error);
+    eventSource.close();
+    showPopup('Download completed or connection closed. Reloading...', 'info');
+    setTimeout(() => location.reload(), 1500);
+  };
+}
+
+function checkOllamaStatus() {
+  fetch('/ollama/status')
+    .then(response => response.json())
+    .then(data => {
+      const statusIcon = document.getElementById('statusIcon');
+      const statusText = document.getElementById('statusText');
+      const statusDiv = document.getElementById('ollamaStatus');
+      
+      const statusDetails = document.getElementById('statusDetails');
+      
+      if (data.connected) {
+        statusIcon.className = 'status-icon online';
+        statusText.innerHTML = `<strong>Ollama Online</strong> - ${data.models} model(s) available`;
+        statusDetails.textContent = `Loaded: ${data.loaded && data.loaded.length ? data.loaded.join(', ') : 'none'} | ${data.latency_ms} ms`;
+        statusDiv.style.borderLeft = '4px solid #4CAF50';
+      } else {
+        statusDetails.textContent = '';
+        statusIcon.className = 'status-icon offline';
+        statusText.innerHTML = `<strong>Ollama Offline</strong> - ${data.error || 'Cannot connect'}`;
+        statusDiv.style.borderLeft = '4px solid #f44336';
+      }
+    })
+    .catch(error => {
+      const statusIcon = document.getElementById('statusIcon');
+      const statusText = document.getElementById('statusText');
+      const statusDiv = document.getElementById('ollamaStatus');
+      
+      statusIcon.className = 'status-icon offline';
+      statusText.innerHTML = '<strong>Ollama Offline</strong> - Connection error';
+      statusDiv.style.borderLeft = '4px solid #f44336';
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+  window.onclick = function(event) {
+    const modal = document.getElementById('newChatModal');
+    if (event.target == modal) {
+      closeNewChatModal();
+    }
+  }
+
+  // Check Ollama status on load
+  checkOllamaStatus();
+  
+  // Check every 10 seconds (server answers from its shared snapshot, 304 when unchanged)
+  setInterval(() => { if (!document.hidden) checkOllamaStatus(); }, 10000);
+});
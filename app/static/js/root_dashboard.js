@@ -0,0 +1,3 @@
+function confirmDelete(username) {
+  return confirm(`Are you sure you want to remove user "${username}"?`);
+}
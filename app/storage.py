@@ -0,0 +1,369 @@
+"""
+State backends - where users, chats, sessions, locks and counters live.
+
+LocalBackend keeps the original single-node layout (users.json / chats.json
+on the data volume, SQLite counters, filesystem sessions). RedisBackend puts
+everything in a Redis-protocol server so several app replicas can serve the
+same user base. Pick one with create_backend(); REDIS_URL selects Redis.
+
+RedisBackend only needs a redis-py compatible client, so it can be exercised
+locally against fakeredis.FakeRedis() without a server:
+
+    python storage.py check              # RedisBackend on fakeredis
+    python storage.py check REDIS_URL    # ...or on a real server (uses a throwaway key prefix)
+"""
+
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from blobs import REF_TTL
+from ratelimit import RedisCounterStore, SQLiteCounterStore
+
+
+class LocalBackend:
+    """JSON files + SQLite on one volume - single node"""
+
+    name = 'local'
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.users_file = os.path.join(data_dir, 'users.json')
+        self.chats_file = os.path.join(data_dir, 'chats.json')
+        self.settings_file = os.path.join(data_dir, 'settings.json')
+        self.locks_dir = os.path.join(data_dir, 'locks')
+        self.sessions_dir = os.path.join(data_dir, 'sessions')
+        self.blobs_dir = os.path.join(data_dir, 'blobs')
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self.counters = SQLiteCounterStore(os.path.join(data_dir, 'counters.db'))
+        self._thread_locks = {}
+        self._thread_locks_guard = threading.Lock()
+
+    @contextmanager
+    def lock(self, name):
+        """Exclusive lock across threads and worker processes"""
+        with self._thread_locks_guard:
+            thread_lock = self._thread_locks.setdefault(name, threading.Lock())
+        with thread_lock:
+            with open(os.path.join(self.locks_dir, f"{name.replace('/', '_')}.lock"), 'a') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                yield
+
+    def _read_json(self, path, default):
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+        return default
+
+    def _write_json(self, path, data, indent):
+        # Write-then-rename so readers never see a half-written file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp, path)
+
+    # Users
+    def load_users(self):
+        return self._read_json(self.users_file, [])
+
+    def save_users(self, users):
+        self._write_json(self.users_file, users, indent=4)
+
+    # Admin settings
+    def load_settings(self):
+        return self._read_json(self.settings_file, {})
+
+    def save_settings(self, settings_data):
+        self._write_json(self.settings_file, settings_data, indent=4)
+
+    # Chats
+    def load_chats(self):
+        return self._read_json(self.chats_file, [])
+
+    def save_chats(self, chats):
+        self._write_json(self.chats_file, chats, indent=2)
+
+    def get_chat(self, chat_id):
+        return next((c for c in self.load_chats() if c['id'] == chat_id), None)
+
+    def list_chats(self, username):
+        return [c for c in self.load_chats() if c['created_by'] == username]
+
+    def save_chat(self, chat):
+        with self.lock('chats-file'):
+            chats = self.load_chats()
+            for i, existing in enumerate(chats):
+                if existing['id'] == chat['id']:
+                    chats[i] = chat
+                    break
+            else:
+                chats.append(chat)
+            self.save_chats(chats)
+
+    def delete_chat(self, chat_id):
+        with self.lock('chats-file'):
+            self.save_chats([c for c in self.load_chats() if c['id'] != chat_id])
+
+    # Blobs (content-addressed message bodies, see blobs.py)
+    def _blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[:2], digest[2:])
+
+    def has_blob(self, digest):
+        return os.path.exists(self._blob_path(digest))
+
+    def put_blob(self, digest, data):
+        path = self._blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get_blob(self, digest):
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete_blob(self, digest):
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def list_blobs(self):
+        if not os.path.isdir(self.blobs_dir):
+            return []
+        return [prefix + rest for prefix in os.listdir(self.blobs_dir) if len(prefix) == 2
+                for rest in os.listdir(os.path.join(self.blobs_dir, prefix)) if '.' not in rest]
+
+    # Sessions
+    def configure_sessions(self, app):
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config['SESSION_FILE_DIR'] = self.sessions_dir
+
+
+class RedisBackend:
+    """Everything in a Redis-protocol server - shared by any number of replicas"""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='vovagpt:'):
+        self.client = client
+        self.prefix = prefix
+        self.counters = RedisCounterStore(client, self._key('counter', ''))
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(parts)
+
+    @contextmanager
+    def lock(self, name, timeout=60):
+        """Distributed lock; expires after `timeout` seconds if a holder dies"""
+        with self.client.lock(self._key('lock', name), timeout=timeout, blocking_timeout=timeout):
+            yield
+
+    # Users
+    def load_users(self):
+        raw = self.client.get(self._key('users'))
+        return json.loads(raw) if raw else []
+
+    def save_users(self, users):
+        self.client.set(self._key('users'), json.dumps(users))
+
+    # Admin settings
+    def load_settings(self):
+        raw = self.client.get(self._key('settings'))
+        return json.loads(raw) if raw else {}
+
+    def save_settings(self, settings_data):
+        self.client.set(self._key('settings'), json.dumps(settings_data))
+
+    # Chats
+    def load_chats(self):
+        chats = [json.loads(raw) for raw in self.client.hvals(self._key('chats'))]
+        return sorted(chats, key=lambda c: c.get('created_at', ''))
+
+    def save_chats(self, chats):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key('chats'))
+        for chat in chats:
+            pipe.hset(self._key('chats'), chat['id'], json.dumps(chat))
+            pipe.sadd(self._key('user_chats', chat['created_by']), chat['id'])
+        pipe.execute()
+
+    def get_chat(self, chat_id):
+        raw = self.client.hget(self._key('chats'), chat_id)
+        return json.loads(raw) if raw else None
+
+    def list_chats(self, username):
+        ids = list(self.client.smembers(self._key('user_chats', username)))
+        if not ids:
+            return []
+        chats = [json.loads(raw) for raw in self.client.hmget(self._key('chats'), ids) if raw]
+        return sorted(chats, key=lambda c: c.get('created_at', ''))
+
+    def save_chat(self, chat):
+        pipe = self.client.pipeline()
+        pipe.hset(self._key('chats'), chat['id'], json.dumps(chat))
+        pipe.sadd(self._key('user_chats', chat['created_by']), chat['id'])
+        pipe.execute()
+
+    def delete_chat(self, chat_id):
+        chat = self.get_chat(chat_id)
+        pipe = self.client.pipeline()
+        pipe.hdel(self._key('chats'), chat_id)
+        if chat:
+            pipe.srem(self._key('user_chats', chat['created_by']), chat_id)
+        pipe.execute()
+
+    # Blobs
+    def has_blob(self, digest):
+        return bool(self.client.exists(self._key('blob', digest)))
+
+    def put_blob(self, digest, data):
+        self.client.set(self._key('blob', digest), data)
+
+    def get_blob(self, digest):
+        return self.client.get(self._key('blob', digest))
+
+    def delete_blob(self, digest):
+        self.client.delete(self._key('blob', digest))
+
+    # Sessions
+    def configure_sessions(self, app):
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = self.client
+        app.config['SESSION_KEY_PREFIX'] = self._key('session', '')
+
+
+def import_local_state(backend, data_dir):
+    """Seed an empty shared backend from the single-node JSON files"""
+    local = LocalBackend(data_dir)
+    with backend.lock('import-local-state'):
+        if backend.load_users() or not local.load_users():
+            return
+        chats = local.load_chats()
+        # Blobs and their reference counts first, so no imported chat points at a missing body
+        blobs = local.list_blobs()
+        for digest in blobs:
+            backend.put_blob(digest, local.get_blob(digest))
+        refs = {}
+        for chat in chats:
+            for message in chat['messages']:
+                if message.get('blob'):
+                    refs[message['blob']] = refs.get(message['blob'], 0) + 1
+        for digest, count in refs.items():
+            backend.counters.incr(f"blobref:{digest}", count, ttl=REF_TTL)
+        backend.save_settings(local.load_settings())
+        backend.save_chats(chats)
+        backend.save_users(local.load_users())
+        print(f"📦 Imported users, chats and {len(blobs)} message blobs from {data_dir} into the {backend.name} backend")
+
+
+def create_backend(data_dir, redis_url=None):
+    if redis_url:
+        try:
+            import redis
+            backend = RedisBackend(redis.Redis.from_url(redis_url))
+            import_local_state(backend, data_dir)
+            return backend
+        except ImportError:
+            print("⚠️  REDIS_URL is set but the redis package is not installed - using local storage")
+    return LocalBackend(data_dir)
+
+
+def check_backend(backend):
+    """Exercise users, chats, blobs, counters, locks and sessions; raises AssertionError on a mismatch"""
+    from flask import Flask, session
+    from flask_session import Session
+
+    backend.save_users([{'username': 'alice'}, {'username': 'bob'}])
+    assert [u['username'] for u in backend.load_users()] == ['alice', 'bob']
+    backend.save_settings({'limits': {'user': 10}})
+    assert backend.load_settings() == {'limits': {'user': 10}}
+
+    chats = [{'id': f'c{i}', 'created_by': 'alice' if i < 2 else 'bob', 'created_at': f'2024-01-0{i + 1}', 'messages': []}
+             for i in range(3)]
+    backend.save_chats(chats)
+    assert [c['id'] for c in backend.list_chats('alice')] == ['c0', 'c1']
+    backend.save_chat(dict(chats[1], title='renamed'))
+    backend.save_chat({'id': 'c3', 'created_by': 'bob', 'created_at': '2024-01-04', 'messages': []})
+    assert backend.get_chat('c1')['title'] == 'renamed'
+    assert [c['id'] for c in backend.list_chats('bob')] == ['c2', 'c3']
+    backend.delete_chat('c2')
+    assert backend.get_chat('c2') is None and [c['id'] for c in backend.list_chats('bob')] == ['c3']
+    assert [c['id'] for c in backend.load_chats()] == ['c0', 'c1', 'c3']
+    assert backend.list_chats('nobody') == []
+
+    backend.put_blob('ab' * 32, b'payload')
+    assert backend.has_blob('ab' * 32) and backend.get_blob('ab' * 32) == b'payload'
+    backend.delete_blob('ab' * 32)
+    assert not backend.has_blob('ab' * 32) and backend.get_blob('ab' * 32) is None
+
+    assert backend.counters.incr('check', 2, ttl=60) == 2
+    assert backend.counters.incr('check', -1, ttl=60) == 1 and backend.counters.get('check') == 1
+
+    # Lock: concurrent holders must never overlap
+    inside, overlaps = [], []
+
+    def hold():
+        for _ in range(5):
+            with backend.lock('check'):
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                time.sleep(0.002)
+                inside.pop()
+
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not overlaps, "lock let two holders in"
+
+    # Sessions survive between requests and are really stored server-side
+    app = Flask(__name__)
+    app.secret_key = 'check'
+    backend.configure_sessions(app)
+    Session(app)
+
+    @app.route('/set')
+    def set_value():
+        session['user_id'] = 'alice'
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('user_id', '')
+
+    client = app.test_client()
+    client.get('/set')
+    assert client.get('/get').get_data(as_text=True) == 'alice'
+    assert app.test_client().get('/get').get_data(as_text=True) == '', "session leaked to a new client"
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['check']:
+        print(__doc__)
+        sys.exit(2)
+    if len(sys.argv) > 2:
+        import redis
+        client = redis.Redis.from_url(sys.argv[2])
+    else:
+        import fakeredis
+        client = fakeredis.FakeRedis()
+    prefix = f"vovagpt-check-{uuid.uuid4().hex[:8]}:"
+    try:
+        check_backend(RedisBackend(client, prefix=prefix))
+    finally:
+        keys = list(client.scan_iter(match=prefix + '*'))
+        if keys:
+            client.delete(*keys)
+    print("✅ RedisBackend check passed")
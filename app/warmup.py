@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Startup helpers used by start.sh.
+
+    python warmup.py wait            # block until Ollama answers (OLLAMA_WAIT_TIMEOUT, default 120s)
+    python warmup.py preload MODEL   # pull if missing, then load MODEL into memory
+
+`preload` is meant to run in the background while gunicorn boots; /readyz
+reports not-ready until it finishes. Storage, memory indexes and the model
+catalog are warmed separately by warm_up() in app.py (called from wsgi.py).
+"""
+
+import json
+import os
+import sys
+import time
+
+import requests
+
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+
+
+def wait_for_ollama(timeout):
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            if requests.get(f"{OLLAMA_HOST}/api/version", timeout=2).status_code == 200:
+                print(f"✅ Ollama ready after {time.monotonic() - started:.1f}s")
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    print(f"⚠️  Ollama did not answer within {timeout}s")
+    return False
+
+
+def preload(model):
+    import app as webapp
+
+    def publish(status, **fields):
+        tmp = f"{webapp.PRELOAD_STATUS_FILE}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(dict(fields, model=model, status=status, started_at=started_at), f)
+        os.replace(tmp, webapp.PRELOAD_STATUS_FILE)
+
+    started_at = time.time()
+    publish('loading')
+    try:
+        if webapp.model_tag(model) not in [webapp.model_tag(m) for m in webapp.get_ollama_models()]:
+            print(f"📥 Pulling {model} for preload...")
+            with requests.post(f"{OLLAMA_HOST}/api/pull", json={"name": model}, stream=True,
+                               timeout=webapp.PRELOAD_TIMEOUT) as response:
+                for line in response.iter_lines():
+                    if line and 'error' in json.loads(line):
+                        raise RuntimeError(json.loads(line)['error'])
+
+        # A generate request without a prompt just loads the model
+        payload = {"model": model}
+        if os.getenv('PRELOAD_KEEP_ALIVE'):
+            payload["keep_alive"] = os.getenv('PRELOAD_KEEP_ALIVE')
+        response = requests.post(f"{OLLAMA_HOST}/api/generate", json=payload, timeout=webapp.PRELOAD_TIMEOUT)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code} - {response.text}")
+    except Exception as e:
+        publish('failed', error=str(e), finished_at=time.time())
+        print(f"❌ Preloading {model} failed: {e}")
+        return False
+    publish('done', finished_at=time.time())
+    print(f"✅ {model} loaded in {time.time() - started_at:.1f}s")
+    return True
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'wait':
+        sys.exit(0 if wait_for_ollama(int(os.getenv('OLLAMA_WAIT_TIMEOUT', '120'))) else 1)
+    elif command == 'preload' and len(sys.argv) > 2:
+        sys.exit(0 if preload(sys.argv[2]) else 1)
+    print(__doc__)
+    sys.exit(2)
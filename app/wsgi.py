@@ -1,5 +1,7 @@
-from app import app
+from app import app, warm_up
+
+# Runs once in the gunicorn master with --preload, so every worker forks warm
+warm_up()
 
 if __name__ == "__main__":
     app.run()
-
@@ -2,7 +2,10 @@
 echo "🚀 Starting Ollama..."
 ollama serve > /tmp/ollama.log 2>&1 &
 echo "⏳ Waiting for Ollama..."
-sleep 5
+python warmup.py wait || echo "⚠️  Starting anyway - /readyz reports not ready until Ollama answers"
+if [ -n "$PRELOAD_MODEL" ]; then
+    echo "🔥 Preloading $PRELOAD_MODEL in the background..."
+    python warmup.py preload "$PRELOAD_MODEL" &
+fi
 echo "🌐 Starting Flask with 10min timeout..."
-exec gunicorn -w 4 -b 0.0.0.0:5000 --timeout 600 --log-level info wsgi:app
-
+exec gunicorn -w 4 -k gthread --threads 4 --keep-alive 75 -b 0.0.0.0:5000 --timeout 600 --preload --log-level info wsgi:app